@@ -0,0 +1,301 @@
+import argparse
+import csv
+from datetime import date, timedelta
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import numpy as np
+
+from project import (WEIGHT_FIELDS, MACROS_FIELDS, INDEX_SUFFIX, collect_data, load_columns, load_year, build_index,
+                     write_binary, load_binary, clean_data, join_data, average_data, window_averages, stream_averages, parallel_averages, draw_graph)
+
+
+def main():
+
+    args = get_args(sys.argv[1:])
+
+    results = run_benchmarks(args.years, args.blank, args.extra, args.repeat, args.draw)
+
+    # Print a table and save the results as JSON
+    for result in results["results"]:
+        print(
+            f'{result["years"]:>3} years {result["rows"]:>7} rows  {result["stage"]:<20} '
+            f'{result["seconds"] * 1000:>10.2f} ms {result["peak_bytes"] / 1024:>10.0f} KiB'
+            )
+
+    if args.out:
+        with open(args.out, "w") as file:
+            json.dump(results, file, indent=2)
+        print(f"File saved: {args.out}")
+
+    if args.compare:
+        with open(args.compare) as file:
+            print(*compare_results(json.load(file), results), sep="\n")
+
+
+def get_args(argv: list) -> argparse.Namespace:
+    """
+    Parse the command-line options.
+
+    :param argv: Command-line arguments, without the program name
+    :type argv: list
+    :return: The parsed options
+    :rtype: argparse.Namespace
+    """
+
+    parser = argparse.ArgumentParser(description="Time each stage of project.py on generated logs.")
+    parser.add_argument("--years", type=int, nargs="+", default=[1, 10, 50], help="years of daily rows to generate, one run each")
+    parser.add_argument("--blank", type=float, default=0.05, help="share of rows with blank values (default: 0.05)")
+    parser.add_argument("--extra", type=int, default=3, help="number of unused columns to add (default: 3)")
+    parser.add_argument("--repeat", type=int, default=3, help="times to run each stage, the fastest is kept (default: 3)")
+    parser.add_argument("--draw", action="store_true", help="also time draw_graph")
+    parser.add_argument("--out", help="save the results as JSON")
+    parser.add_argument("--compare", metavar="FILE", help="compare with results saved earlier with --out")
+    return parser.parse_args(argv)
+
+
+def generate_logs(directory: str, years: int, blank: float = 0.05, extra: int = 3, seed: int = 0) -> list:
+    """
+    Generate a weight and a macros CSV file in the same format as the tracking files, with one
+    row per day for a number of years ending with last year. Weight uses comma decimals ("74,5"),
+    some rows are left blank and unused columns are added to both files.
+
+    :param directory: Directory to save the files in
+    :type directory: str
+    :param years: Number of years of daily rows
+    :type years: int
+    :param blank: Share of rows (0-1) where the values are left blank
+    :type blank: float
+    :param extra: Number of unused columns to add
+    :type extra: int
+    :param seed: Seed for the random values, the same seed gives the same files
+    :type seed: int
+    :return: A list with the weight file and the macros file
+    :rtype: list
+    """
+
+    rng = random.Random(seed)
+    extra_fields = [f"Extra {i + 1}" for i in range(extra)]
+
+    last_year = date.today().year - 1
+    start = date(last_year - years + 1, 1, 1)
+    days = (date(last_year + 1, 1, 1) - start).days
+
+    weight_file = os.path.join(directory, f"weight_{years}.csv")
+    macros_file = os.path.join(directory, f"macros_{years}.csv")
+
+    with open(weight_file, "w", newline="") as weight, open(macros_file, "w", newline="") as macros:
+        weight_writer = csv.writer(weight)
+        macros_writer = csv.writer(macros)
+        weight_writer.writerow([*WEIGHT_FIELDS, *extra_fields])
+        macros_writer.writerow([*MACROS_FIELDS, *extra_fields])
+
+        current = 74.0
+        for day in range(days):
+            today = str(start + timedelta(days=day))
+            extras = [rng.choice(["", "ok", "rest day", "1200"]) for _ in extra_fields]
+
+            # Weight drifts slowly, written with a comma as decimal separator
+            current = min(max(current + rng.uniform(-0.3, 0.3), 60.0), 90.0)
+            if rng.random() < blank:
+                weight_writer.writerow([today, "", *extras])
+            else:
+                weight_writer.writerow([today, f"{current:.1f}".replace(".", ","), *extras])
+
+            if rng.random() < blank:
+                macros_writer.writerow([today, "", "", "", "", *extras])
+            else:
+                macros_writer.writerow([
+                    today, rng.randint(1500, 2600), rng.randint(140, 220), rng.randint(35, 90), rng.randint(90, 260), *extras
+                    ])
+
+    return [weight_file, macros_file]
+
+
+def measure(function, *args) -> list:
+    """
+    Run a function once while tracing memory allocations.
+
+    :param function: Function to run
+    :type function: function
+    :return: A list with the result of the function and the peak memory allocated (bytes)
+    :rtype: list
+    """
+
+    tracemalloc.start()
+    try:
+        result = function(*args)
+        _, peak = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+    return [result, peak]
+
+
+def time_stage(function, *args, repeat: int = 3) -> list:
+    """
+    Time a function, the fastest of repeat runs is kept. Peak memory is measured in a separate
+    run since tracing allocations slows the function down.
+
+    :param function: Function to time
+    :type function: function
+    :param repeat: Number of timed runs
+    :type repeat: int
+    :return: A list with the result of the function, the time (seconds) and peak memory (bytes)
+    :rtype: list
+    """
+
+    best = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = function(*args)
+        seconds = time.perf_counter() - start
+        best = seconds if best is None else min(best, seconds)
+
+    _, peak = measure(function, *args)
+    return [result, best, peak]
+
+
+def run_benchmarks(years: list, blank: float = 0.05, extra: int = 3, repeat: int = 3, draw: bool = False) -> dict:
+    """
+    Generate logs for each number of years and time each stage of the program on them:
+    collect_data, load_columns, clean_data and average_data (for both lists of dictionaries and
+    columns, and with quantiles), window_averages, join_data, stream_averages, parallel_averages,
+    build_index, load_year, write_binary, load_binary and, optionally, draw_graph. Only the macros
+    file is timed for the data stages (joined with the weight file for join_data), since it has
+    the most fields.
+
+    :param years: Numbers of years of daily rows to generate, one run each
+    :type years: list
+    :param blank: Share of rows (0-1) where the values are left blank
+    :type blank: float
+    :param extra: Number of unused columns to add
+    :type extra: int
+    :param repeat: Number of timed runs per stage
+    :type repeat: int
+    :param draw: Also time draw_graph
+    :type draw: bool
+    :return: A dictionary with information about the run (versions, commit) and a list of results
+    :rtype: dict
+    """
+
+    results = []
+
+    with tempfile.TemporaryDirectory() as directory:
+        for count in years:
+            weight_file, macros_file = generate_logs(directory, count, blank, extra)
+            year = str(date.today().year - 1)
+
+            def stage(name, function, *args):
+                result, seconds, peak = time_stage(function, *args, repeat=repeat)
+                results.append({"years": count, "rows": rows, "stage": name, "seconds": seconds, "peak_bytes": peak})
+                return result
+
+            rows = len(collect_data(macros_file, MACROS_FIELDS))
+
+            rows_data = stage("collect_data", collect_data, macros_file, MACROS_FIELDS)
+            rows_clean = stage("clean_data", clean_data, rows_data, year)
+            stage("average_data", average_data, rows_clean)
+
+            columns = stage("load_columns", load_columns, macros_file, MACROS_FIELDS)
+            columns_clean = stage("clean_data columns", clean_data, columns, year)
+            macros_average = stage("average_data columns", average_data, columns_clean)
+
+            stage("average_data quantiles", average_data, columns_clean, True)
+            stage("window_averages 28", window_averages, columns_clean, 28)
+
+            # Every year of both files, joined by date
+            weight_all = clean_data(load_columns(weight_file, WEIGHT_FIELDS), None)
+            stage("join_data", join_data, clean_data(columns, None), weight_all, "outer", 7)
+
+            stage("stream_averages", stream_averages, macros_file, MACROS_FIELDS, year)
+            stage("parallel_averages", parallel_averages, macros_file, MACROS_FIELDS, year)
+
+            # The index is built once, after that only the rows of the year are read
+            stage("build_index", _new_index, macros_file)
+            stage("load_year", load_year, macros_file, MACROS_FIELDS, year)
+
+            binary_file = os.path.join(directory, f"macros_{count}.amwg")
+            stage("write_binary", write_binary, macros_file, binary_file)
+            stage("load_binary", load_binary, binary_file, MACROS_FIELDS)
+
+            if draw:
+                weight_average = average_data(clean_data(load_columns(weight_file, WEIGHT_FIELDS), year))
+                stage("draw_graph", draw_graph, weight_average, macros_average, year, os.path.join(directory, "averages.png"))
+
+    return {"info": _run_info(), "blank": blank, "extra": extra, "repeat": repeat, "results": results}
+
+
+def compare_results(old: dict, new: dict) -> list:
+    """
+    Compare two sets of results from run_benchmarks, stage by stage.
+
+    :param old: Earlier results
+    :type old: dict
+    :param new: Current results
+    :type new: dict
+    :return: One line per stage found in both, with the times and how many times slower/faster
+    :rtype: list
+    """
+
+    earlier = {(result["years"], result["stage"]): result for result in old["results"]}
+    lines = [f'Compared with {old["info"].get("commit") or "earlier results"}:']
+
+    for result in new["results"]:
+        if (before := earlier.get((result["years"], result["stage"]))) is None:
+            continue
+        ratio = result["seconds"] / before["seconds"] if before["seconds"] else float("inf")
+        lines.append(
+            f'{result["years"]:>3} years  {result["stage"]:<20} {before["seconds"] * 1000:>10.2f} ms -> '
+            f'{result["seconds"] * 1000:>10.2f} ms  ({ratio:.2f}x)'
+            )
+
+    return lines
+
+
+def _new_index(f: str) -> dict:
+    """
+    Build the date index of a file from scratch, removing the saved one first.
+
+    :param f: File to index
+    :type f: str
+    :return: The index, see build_index
+    :rtype: dict
+    """
+
+    if os.path.exists(f"{f}{INDEX_SUFFIX}"):
+        os.remove(f"{f}{INDEX_SUFFIX}")
+    return build_index(f)
+
+
+def _run_info() -> dict:
+    """
+    Information about where the benchmarks ran, so results from different commits or machines
+    can be told apart.
+
+    :return: Time, commit, Python, numpy and platform
+    :rtype: dict
+    """
+
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+            cwd=os.path.dirname(os.path.abspath(__file__))
+            ).stdout.strip() or None
+    except OSError:
+        commit = None
+
+    return {
+        "time": time.strftime("%Y-%m-%dT%H:%M:%S"), "commit": commit, "python": platform.python_version(),
+        "numpy": np.__version__, "platform": platform.platform(),
+        }
+
+
+if __name__ == "__main__":
+    main()
@@ -1,212 +1,3004 @@
+import argparse
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
 import csv
 from datetime import datetime
-import matplotlib.pyplot as plt
+from fractions import Fraction
+from functools import partial
+import hashlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+import io
+from itertools import accumulate
+import json
+import math
+import numpy as np
 import os
 import re
-from statistics import mean
 import sys
+import threading
+import time
+import tracemalloc
+from urllib.parse import parse_qs, urlparse
+
+
+# Fields used from the weight and macros files
+WEIGHT_FIELDS = ["Date", "Weight"]
+MACROS_FIELDS = ["Date", "Calories", "Protein (g)", "Fat (g)", "Carbs (g)"]
+
+# How each column is converted, see Converter. Numbers may use either "." or "," as decimal separator
+# ("74.5" and "74,5"), columns not listed here are numbers as well
+SCHEMA = {
+    "Date": {"type": "date"},
+    "Weight": {"type": "number", "decimal": "either"},
+    "Calories": {"type": "number", "decimal": "either"},
+    "Protein (g)": {"type": "number", "decimal": "either"},
+    "Fat (g)": {"type": "number", "decimal": "either"},
+    "Carbs (g)": {"type": "number", "decimal": "either"},
+}
+DEFAULT_COLUMN = {"type": "number", "decimal": "either"}
+
+# Numbers that couldn't be converted in a column (see Converter.column) are a NaN with another payload
+# than blank values, so clean_data can still tell them apart when it drops the rows
+INVALID_BITS = 0x7FFC000000000000
+INVALID = float(np.array([INVALID_BITS], dtype=np.int64).view(np.float64)[0])
+
+# Month names in the same format average_data uses, index 0 is January
+MONTHS = ["{0:%B}".format(datetime(2000, month, 1)) for month in range(1, 13)]
+
+# Style used for the graph, loaded once, and the plot object reused between graphs
+STYLE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), "pitayasmoothie-dark.mplstyle")
+_STYLE = None
+_FIGURE = None
+
+# Most labels on the x-axis of a graph (one per month), longer series (see window_averages) only label
+# some of the points and leave out the values on the bars. Series with more points than GRAPH_POINTS
+# are drawn as plain lines, without markers or bars
+GRAPH_LABELS = 12
+GRAPH_POINTS = 31
+
+# Where parsed files are cached and how large the cache may grow (bytes) before the least recently
+# used entries are removed
+CACHE_DIR = os.environ.get("AMWG_CACHE_DIR", os.path.join(os.path.expanduser("~"), ".cache", "amwg"))
+CACHE_SIZE = 64 * 1024 * 1024
+
+# How many bytes of rendered graphs, and how many parsed files, the report server keeps in memory
+SERVER_CACHE_SIZE = 32 * 1024 * 1024
+SERVER_FILES = 16
+
+# Size (bytes) of the parts a file is split into by parallel_averages
+CHUNK_SIZE = 4 * 1024 * 1024
+
+# Quantiles added by average_data and stream_averages when asked for, and how many values (per field
+# and month) they're calculated exactly from before being estimated, see QuantileEstimator
+QUANTILES = {"p10": 0.1, "median": 0.5, "p90": 0.9}
+EXACT_QUANTILES = 100
+
+# Binary columnar files (see write_binary) start with MAGIC and use this extension
+BINARY_EXTENSION = ".amwg"
+MAGIC = b"AMWGCOL1"
+NO_DATE = np.iinfo(np.int32).min
+
+# Date indexes are saved next to the CSV file, with this added to its name
+INDEX_SUFFIX = ".index.json"
 
 
 def main():
 
-    WEIGHT_FIELDS = ["Date", "Weight"]
-    MACROS_FIELDS = ["Date", "Calories", "Protein (g)", "Fat (g)", "Carbs (g)"]
+    args = get_args(sys.argv[1:])
+
+    if args.clear_cache:
+        print(f"Removed {clear_cache()} cached file(s)")
+        return
+
+    # Convert between CSV and binary columnar files
+    if args.convert:
+        for f in args.convert:
+            try:
+                print(export_csv(f, args.out) if _is_binary(f) else write_binary(f, args.out, args.float32))
+            except ValueError as err:
+                sys.exit(err)
+        return
+
+    # Serve graphs and averages over HTTP until stopped
+    if args.serve is not None:
+        server = make_server(args.serve, args.weight, args.macros)
+        print(f"Serving on http://127.0.0.1:{server.server_address[1]}/averages.png?year=YYYY, press Ctrl+C to stop")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            server.server_close()
+            server.cache.close()
+        return
+
+    # Parsed files are cached unless asked not to
+    load = load_columns if args.no_cache else load_columns_cached
+
+    # Run every job in a manifest and print a summary
+    if args.manifest:
+        try:
+            results = run_manifest(args.manifest, load=load)
+        except ValueError as err:
+            sys.exit(err)
+        for job, _, message in results:
+            print(f"{job}: {message}")
+        failed = [job for job, ok, _ in results if not ok]
+        sys.exit(f"{len(failed)} of {len(results)} job(s) failed" if failed else None)
+
+    # Get inputs, from the command line or by asking
+    year_needed = not (args.years or args.all_years)
+    if args.weight and args.macros and (args.year or not year_needed):
+        weight_file, macros_file, year = args.weight, args.macros, args.year
+    elif args.weight or args.macros or args.year:
+        sys.exit("Please provide --weight, --macros and --year together, or none of them")
+    elif year_needed:
+        weight_file, macros_file, year = get_files_year()
+    else:
+        weight_file, macros_file = get_files_year(ask_year=False)
+
+    # Save the graph again whenever the files change
+    if args.watch is not None:
+        print(f"Watching {weight_file} and {macros_file}, press Ctrl+C to stop")
+        try:
+            watch(weight_file, macros_file, year, args.out, args.format, args.watch)
+        except KeyboardInterrupt:
+            pass
+        return
+
+    # Graph several years from one read of the files
+    if not year_needed:
+        try:
+            messages = graph_years(
+                weight_file, macros_file, WEIGHT_FIELDS, MACROS_FIELDS, args.years, load, args.out, args.format
+                )
+        except ValueError as err:
+            sys.exit(err)
+        print(*messages, sep="\n")
+        return
+
+    # Read, clean and average each file in a single pass, in parallel parts, or only the rows added 
+    # since last time
+    if args.stream or args.parallel or args.incremental:
+        if args.stream:
+            average = partial(stream_averages, quantiles=args.quantiles)
+        else:
+            average = parallel_averages if args.parallel else incremental_averages
+        try:
+            weight_average = average(weight_file, WEIGHT_FIELDS, year)
+            macros_average = average(macros_file, MACROS_FIELDS, year)
+        except ValueError as err:
+            sys.exit(err)
+
+        # Save the graph (or the numbers) and print save location
+        if args.format:
+            print(write_averages(weight_average, macros_average, year, args.format, args.out))
+            return
+        try:
+            print(draw_graph(weight_average, macros_average, year, args.out)) 
+        except KeyError:
+            sys.exit("Something went wrong. You might have switched up your file inputs.")
+        return
+
+    # Only read the rows of the year from files sorted by date
+    if args.index:
+        load = partial(load_year, year=year)
+
+    # Collect, clean, (join,) average and save the graph, with statistics about each stage if asked for
+    on_stats = (lambda stats: _write_stats(stats, args.profile)) if args.profile else None
+    try:
+        print(run_job(
+            weight_file, macros_file, year, args.out, load, args.format, on_stats, args.join, args.lag, args.window, args.quantiles
+            ))
+    except ValueError as err:
+        sys.exit(err)
+    except KeyError:
+        sys.exit("Something went wrong. You might have switched up your file inputs.")
+
+
+def get_args(argv: list) -> argparse.Namespace:
+    """ 
+    Parse the command-line options.
+
+    :param argv: Command-line arguments, without the program name
+    :type argv: list
+    :return: The parsed options
+    :rtype: argparse.Namespace
+    """
+
+    parser = argparse.ArgumentParser(description="Graph average weight and macros per month for a year.")
+    parser.add_argument("--weight", type=_csv_argument, help="CSV file with weight, asked for if not given")
+    parser.add_argument("--macros", type=_csv_argument, help="CSV file with macros, asked for if not given")
+    parser.add_argument("--year", type=_year_argument, metavar="YYYY", help="year to graph, asked for if not given")
+    parser.add_argument(
+        "--out", 
+        help="where to save the graph, a directory with --years/--all-years (default: averages_<year>.png in the current directory)"
+        )
+    parser.add_argument(
+        "--format", choices=["json", "csv"],
+        help="write the averages in this format instead of drawing the graph (to --out, or printed if not given)"
+        )
+    mode = parser.add_mutually_exclusive_group()
+    mode.add_argument(
+        "--stream", action="store_true", 
+        help="read, clean and average each file in a single pass with constant memory"
+        )
+    mode.add_argument(
+        "--parallel", action="store_true",
+        help="like --stream, but large files are split into parts that are read on all CPUs"
+        )
+    mode.add_argument(
+        "--incremental", action="store_true",
+        help="save the monthly sums and only read rows added to the files since the last run"
+        )
+    mode.add_argument(
+        "--years", type=_year_range, metavar="YYYY[-YYYY]",
+        help="save one graph per year in the range, the files are only read once"
+        )
+    mode.add_argument("--all-years", action="store_true", help="save one graph per year found in the files")
+    mode.add_argument(
+        "--manifest", metavar="FILE",
+        help="JSON or CSV list of jobs (weight, macros, year, out) to run in parallel"
+        )
+    mode.add_argument(
+        "--convert", nargs="+", type=_csv_argument, metavar="FILE",
+        help=f"convert CSV files to binary columnar files ({BINARY_EXTENSION}, loaded without parsing) and back"
+        )
+    mode.add_argument(
+        "--watch", nargs="?", type=float, const=1.0, metavar="SECONDS",
+        help="save the graph again whenever the files change, checked every SECONDS (default: 1)"
+        )
+    mode.add_argument(
+        "--serve", nargs="?", type=int, const=8000, metavar="PORT",
+        help="serve graphs (/averages.png) and averages (/averages.json) over HTTP, on port 8000 by default"
+        )
+    parser.add_argument("--float32", action="store_true", help="store the values as float32 with --convert")
+    parser.add_argument(
+        "--profile", nargs="?", const="-", metavar="FILE",
+        help="write the time and memory of each stage and the row counts as JSON to FILE (default: stderr)"
+        )
+    parser.add_argument(
+        "--index", action="store_true",
+        help="only read the rows of the year, using a date index saved next to each file (files sorted by date)"
+        )
+    parser.add_argument(
+        "--join", choices=["inner", "outer"],
+        help="join the macros and weight by date before averaging, only the days in both (inner) or every day (outer)"
+        )
+    parser.add_argument(
+        "--lag", type=int, default=0, metavar="DAYS",
+        help="with --join, join the macros of each day with the weight DAYS later (default: 0)"
+        )
+    parser.add_argument(
+        "--window", type=_window_argument, default="month", metavar="{day,week,month,DAYS}",
+        help="average per day, ISO week or month (default), or a rolling average over a number of days"
+        )
+    parser.add_argument(
+        "--quantiles", action="store_true",
+        help="also calculate the monthly median and 10th/90th percentiles, drawn as bands on the graph"
+        )
+    parser.add_argument("--no-cache", action="store_true", help="always parse the files, don't use or update the cache")
+    parser.add_argument("--clear-cache", action="store_true", help="remove all cached files and exit")
+    args = parser.parse_args(argv)
+
+    if args.watch is not None and args.watch <= 0:
+        parser.error("--watch needs a number of seconds above 0")
+    if args.convert and args.out and len(args.convert) > 1:
+        parser.error("--out can only be used with --convert for a single file")
+    if args.lag and not args.join:
+        parser.error("--lag can only be used with --join")
+
+    # The rows joined with the last (or first) days of the year can be from the year next to it
+    if args.index and args.join:
+        parser.error("--index can't be used with --join")
+    if args.quantiles and (args.window != "month" or args.parallel or args.incremental or args.years or args.all_years
+                           or args.manifest or args.convert or args.serve is not None or args.watch is not None):
+        parser.error("--quantiles can only be used with monthly averages, by default or with --stream")
+
+    # Only the default mode runs the stages one by one, for a single year
+    for option, used in [["--profile", args.profile], ["--index", args.index], ["--join", args.join],
+                         ["--window", args.window != "month"]]:
+        if used and (args.stream or args.parallel or args.incremental or args.years or args.all_years or args.manifest 
+                     or args.convert or args.serve is not None or args.watch is not None):
+            parser.error(
+                f"{option} can't be used with --stream, --parallel, --incremental, --years, --all-years, --manifest, "
+                "--convert, --serve or --watch"
+                )
+    return args
+
+
+def _write_stats(stats: dict, f: str) -> None:
+    """ 
+    Write the run statistics from run_job as JSON.
+
+    :param stats: Run statistics
+    :type stats: dict
+    :param f: File to write to, "-" for stderr
+    :type f: str
+    """
+
+    if f == "-":
+        print(json.dumps(stats, indent=2), file=sys.stderr)
+        return
+    with open(f, "w") as file:
+        json.dump(stats, file, indent=2)
+
+
+def _csv_argument(value: str) -> str:
+    """ 
+    Validate a CSV file given on the command line, same checks as get_files_year.
+
+    :param value: The file
+    :type value: str
+    :raise argparse.ArgumentTypeError: If it's not a CSV or it doesn't exist
+    :return: The file
+    :rtype: str
+    """
+
+    try:
+        return check_csv(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+
+
+def _window_argument(value: str):
+    """ 
+    Type for the --window option, see window_averages.
+
+    :param value: "day", "week", "month" or a number of days
+    :type value: str
+    :raise argparse.ArgumentTypeError: If the value is none of them
+    :return: The window name, or the number of days as an int
+    :rtype: str
+    """
+
+    if value in ("day", "week", "month"):
+        return value
+    if value.isdecimal() and int(value) > 0:
+        return int(value)
+    raise argparse.ArgumentTypeError(f'must be "day", "week", "month" or a number of days above 0, not {value!r}')
+
+
+def _year_argument(value: str) -> str:
+    """ 
+    Validate a year given on the command line, same check as get_files_year.
+
+    :param value: The year
+    :type value: str
+    :raise argparse.ArgumentTypeError: If it's not in YYYY format
+    :return: The year
+    :rtype: str
+    """
+
+    try:
+        return check_year(value)
+    except ValueError as err:
+        raise argparse.ArgumentTypeError(str(err))
+
+
+def run_job(weight_file: str, macros_file: str, year: str, out: str = None, load=None, fmt: str = None,
+            on_stats=None, join: str = None, lag: int = 0, window="month", quantiles: bool = False) -> str:
+    """ 
+    Collect, clean and average the weight and macros files for a year and save the graph, or 
+    write the averages if a format is given. If join is given, the macros of each day are joined
+    with the weight lag days later (see join_data) before averaging, so only the days found in
+    both files (or every day, for an outer join) are used.
+
+    :param weight_file: CSV file with weight
+    :type weight_file: str
+    :param macros_file: CSV file with macros
+    :type macros_file: str
+    :param year: Year to graph
+    :type year: str
+    :param out: Where to save the graph, see draw_graph
+    :type out: str
+    :param load: Function used to read the files, defaults to load_columns
+    :type load: function
+    :param fmt: Write the averages as "json" or "csv" instead of drawing the graph, see write_averages
+    :type fmt: str
+    :param on_stats: Called with the run statistics when the job is done (or has failed): the wall
+        time and peak memory of each stage, the blank and invalid values in each file (see 
+        load_columns, load needs to take errors as well) and the row counts, see clean_data. Tracing
+        memory slows the code down, so the peaks come from running the job a second time
+    :type on_stats: function
+    :param join: "inner" or "outer" to join the files by date, see join_data
+    :type join: str
+    :param lag: Number of days after the macros the weight is joined from
+    :type lag: int
+    :param window: Average per "day", "week", "month" or rolling number of days, see window_averages
+    :type window: str
+    :param quantiles: Also add the monthly quantiles, see average_data, drawn as bands on the graph
+    :type quantiles: bool
+    :raise ValueError: If the files or the data in them are not valid
+    :raise KeyError: If the weight and macros files are switched
+    :return: String displaying where file was saved (or the averages, if fmt is given without out)
+    :rtype: str
+    """
+
+    job = partial(_run_stages, weight_file, macros_file, year, out, load or load_columns, fmt, join, lag, window, quantiles)
+    if not on_stats:
+        return job(None)
+
+    # Time the stages without tracing memory, then trace it in a second run (unless it's traced already)
+    stats = _new_stats(year)
+    try:
+        result = job(stats)
+        if not tracemalloc.is_tracing():
+            traced = _new_stats(year)
+            tracemalloc.start()
+            try:
+                job(traced)
+            finally:
+                tracemalloc.stop()
+            for name, stage in traced["stages"].items():
+                stats["stages"][name]["peak_bytes"] = stage["peak_bytes"]
+        return result
+    except (ValueError, KeyError) as err:
+        stats["error"] = str(err)
+        raise
+    finally:
+        on_stats(stats)
+
+
+def _new_stats(year: str) -> dict:
+    """ 
+    Empty run statistics for run_job.
+
+    :param year: Year of the job
+    :type year: str
+    :return: The statistics, stages and the weight and macros files to be filled in
+    :rtype: dict
+    """
+
+    return {"year": year, "stages": {}, "weight": {}, "macros": {}}
+
+
+def _run_stages(weight_file: str, macros_file: str, year: str, out: str, load, fmt: str, join: str, lag: int,
+                window, quantiles: bool, stats: dict) -> str:
+    """ 
+    The stages of run_job, each measured in stats (see _stage) if it's given.
+
+    :param stats: Run statistics, see run_job, or None
+    :type stats: dict
+    :return: See run_job
+    :rtype: str
+    """
+
+    # Collect data from csv, as columns so only the requested fields are kept
+    with _stage(stats, "collect"):
+        if stats:
+            weight_data = load(weight_file, WEIGHT_FIELDS, errors=stats["weight"].setdefault("errors", {}))
+            macros_data = load(macros_file, MACROS_FIELDS, errors=stats["macros"].setdefault("errors", {}))
+        else:
+            weight_data = load(weight_file, WEIGHT_FIELDS)
+            macros_data = load(macros_file, MACROS_FIELDS)
+
+    # Cleanup the data in the files, every year is kept when joining since the lag can reach into the next
+    with _stage(stats, "clean"):
+        weight_clean = clean_data(weight_data, None if join else year, stats["weight"] if stats else None)
+        macros_clean = clean_data(macros_data, None if join else year, stats["macros"] if stats else None)
+
+    # Join the macros of each day with the weight lag days later, and average them together
+    if join:
+        with _stage(stats, "join"):
+            joined = join_data(macros_clean, weight_clean, join, lag, year)
+        if stats:
+            stats["join"] = {"how": join, "lag": lag, "rows": len(joined["Date"])}
+        if len(joined["Date"]) == 0:
+            raise ValueError(f"Data contains no joined entries for {year}")
+
+    # Average the data and save the graph, or only the numbers
+    with _stage(stats, "average"):
+        if join:
+            weight_average = macros_average = window_averages(joined, window, quantiles)
+        else:
+            weight_average = window_averages(weight_clean, window, quantiles)
+            macros_average = window_averages(macros_clean, window, quantiles)
+    if stats:
+        stats["weight"]["months"] = max(map(len, weight_average.values()))
+        stats["macros"]["months"] = max(map(len, macros_average.values()))
+
+    with _stage(stats, "write" if fmt else "draw"):
+        if fmt:
+            return write_averages(weight_average, macros_average, year, fmt, out)
+        return draw_graph(weight_average, macros_average, year, out)
+
+
+@contextmanager
+def _stage(stats: dict, name: str):
+    """ 
+    Measure the wall time (seconds) and peak memory (bytes allocated while tracing) of the code in
+    the with block and save them in stats["stages"][name]. Does nothing if stats is None, the 
+    peak is 0 if memory isn't traced (see tracemalloc, run_job traces it in a run of its own).
+
+    :param stats: Run statistics, see run_job
+    :type stats: dict
+    :param name: Name of the stage
+    :type name: str
+    """
+
+    if stats is None:
+        yield
+        return
+
+    start_memory = 0
+    if tracemalloc.is_tracing():
+        tracemalloc.reset_peak()
+        start_memory = tracemalloc.get_traced_memory()[0]
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        seconds = time.perf_counter() - start
+        peak = tracemalloc.get_traced_memory()[1] - start_memory if tracemalloc.is_tracing() else 0
+        stats["stages"][name] = {"seconds": seconds, "peak_bytes": peak}
+
+
+def run_manifest(f: str, workers: int = None, load=None) -> list:
+    """ 
+    Run every job in a manifest in parallel, one process per job (up to workers processes). The
+    manifest is either a JSON list of objects or a CSV file, with the keys/fields "weight", 
+    "macros", "year" and optionally "out" and "format" (see run_job). Each job is checked the same way as get_files_year 
+    checks its input.
+
+    :param f: The manifest, .json or .csv
+    :type f: str
+    :param workers: Max number of processes, defaults to the number of CPUs
+    :type workers: int
+    :param load: Function used to read the files, defaults to load_columns
+    :type load: function
+    :raise ValueError: If the manifest can't be read
+    :return: A list of [job, ok, message] for each job, ok is False if the job failed and message is
+        where the file was saved (or the averages, see run_job) or the error
+    :rtype: list
+    """
+
+    jobs = _read_manifest(f)
+    results = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = []
+        for job in jobs:
+            try:
+                arguments = [check_csv(job["weight"]), check_csv(job["macros"]), check_year(str(job["year"])), job.get("out") or None]
+            except KeyError as err:
+                futures.append(f"Missing {err}")
+            except ValueError as err:
+                futures.append(str(err))
+            else:
+                futures.append(executor.submit(run_job, *arguments, load, job.get("format") or None))
+
+        for i, future in enumerate(futures, start=1):
+            if isinstance(future, str):
+                results.append([f"Job {i}", False, f"Error: {future}"])
+                continue
+            try:
+                results.append([f"Job {i}", True, future.result()])
+            except (ValueError, OSError) as err:
+                results.append([f"Job {i}", False, f"Error: {err}"])
+            except KeyError:
+                results.append([f"Job {i}", False, "Error: Something went wrong. You might have switched up your file inputs."])
+
+    return results
+
+
+def _read_manifest(f: str) -> list:
+    """ 
+    Read the jobs from a manifest, see run_manifest.
+
+    :param f: The manifest, .json or .csv
+    :type f: str
+    :raise ValueError: If the manifest can't be read or isn't a list of jobs
+    :return: A list of dictionaries, one per job
+    :rtype: list
+    """
+
+    try:
+        with open(f, "r", newline="") as file:
+            if os.path.splitext(f)[1] == ".json":
+                jobs = json.load(file)
+            else:
+                jobs = [*csv.DictReader(file)]
+    except (OSError, json.JSONDecodeError) as err:
+        raise ValueError(f"Could not read manifest: {err}")
+
+    if not isinstance(jobs, list) or not all(isinstance(job, dict) for job in jobs):
+        raise ValueError("The manifest should be a list of jobs")
+
+    return jobs
+
+
+def _year_range(value: str) -> list:
+    """ 
+    Parse a year (YYYY) or an inclusive range of years (YYYY-YYYY) from the command line.
+
+    :param value: Year or range of years
+    :type value: str
+    :raise argparse.ArgumentTypeError: If it's not a year or a valid range of years
+    :return: A list of the years (str)
+    :rtype: list
+    """
+
+    if not (match := re.search(r"^(\d{4})(?:-(\d{4}))?$", value)):
+        raise argparse.ArgumentTypeError("Please provide a year in YYYY format, or a range as YYYY-YYYY")
+
+    start = int(match.group(1))
+    end = int(match.group(2) or start)
+    if end < start:
+        raise argparse.ArgumentTypeError(f"{value} ends before it starts")
+
+    return [str(year) for year in range(start, end + 1)]
+
+
+def graph_years(
+        weight_file: str, macros_file: str, weight_fields: list, macros_fields: list, years: list = None, load=None,
+        out: str = None, fmt: str = None
+        ) -> list:
+    """ 
+    Save a graph for each year. Each file is read once and split by year, then every year is 
+    cleaned and averaged and the graphs are drawn in parallel. A year without usable data in 
+    either file is skipped with a message.
+
+    :param weight_file: CSV file with weight
+    :type weight_file: str
+    :param macros_file: CSV file with macros
+    :type macros_file: str
+    :param weight_fields: Fields to read from the weight file
+    :type weight_fields: list
+    :param macros_fields: Fields to read from the macros file
+    :type macros_fields: list
+    :param years: Years (str) to graph, defaults to every year in either file
+    :type years: list
+    :param load: Function used to read the files, defaults to load_columns
+    :type load: function
+    :param out: Directory to save the graphs in, defaults to the current working directory
+    :type out: str
+    :param fmt: Save the averages as averages_<year>.json/.csv instead of graphs, see write_averages
+    :type fmt: str
+    :raise ValueError: If a file can't be read, same errors as collect_data
+    :return: One message per year, where the file was saved, why it was skipped or why it couldn't
+        be saved
+    :rtype: list
+    """
+
+    load = load or load_columns
+    weight_years = partition_years(load(weight_file, weight_fields))
+    macros_years = partition_years(load(macros_file, macros_fields))
+
+    if years is None:
+        years = sorted(weight_years.keys() | macros_years.keys())
+
+    graphs = []
+    messages = {}
+
+    for year in years:
+        try:
+            # An empty year still goes through clean_data to get the usual error
+            weight_average = average_data(clean_data(weight_years.get(year, _empty_columns(weight_fields)), year))
+            macros_average = average_data(clean_data(macros_years.get(year, _empty_columns(macros_fields)), year))
+        except ValueError as err:
+            messages[year] = f"{year}: {err}"
+            continue
+        graphs.append([weight_average, macros_average, year, out and os.path.join(out, f"averages_{year}.png")])
+
+    # Only the numbers, no need to start any processes
+    if fmt:
+        for weight_average, macros_average, year, _ in graphs:
+            try:
+                messages[year] = write_averages(
+                    weight_average, macros_average, year, fmt, os.path.join(out or os.getcwd(), f"averages_{year}.{fmt}")
+                    )
+            except OSError as err:
+                messages[year] = f"{year}: {err}"
+        return [messages[year] for year in years]
+
+    for graph, message in zip(graphs, draw_graphs(graphs)):
+        messages[graph[2]] = message
+
+    return [messages[year] for year in years]
+
+
+def _empty_columns(fields: list) -> dict:
+    """ 
+    Columns without any rows, same layout as load_columns.
+
+    :param fields: Fields to create columns for
+    :type fields: list
+    :return: Dictionary of empty columns
+    :rtype: dict
+    """
+
+    return {field: np.array([], dtype="datetime64[D]" if field == "Date" else np.float64) for field in fields}
+
+
+def collect_data(f: str, fields: list) -> list:
+    """ 
+    Collect data from CSV file. Compatibility view over the columnar reader, see load_columns
+    for the typed version.
+
+    :param f: File to read from
+    :type f: str
+    :param fields: Fields to read and return
+    :type fields: list
+    :raise ValueError: If fields is empty. If specified fields are missing/incorrect in the file
+        If no data was appended
+    :return: A list of dictionaries containing specified fields and their values, one dict per row
+    :rtype: list
+    """
+
+    columns = _read_columns(f, fields)
+    names = [*columns.keys()]
+
+    # Zip the columns back together, one dict per row
+    return [dict(zip(names, values)) for values in zip(*columns.values())]
+
+
+def load_columns(f: str, fields: list, errors: dict = None) -> dict:
+    """ 
+    Collect data from CSV file as columns. Only the specified fields are kept, "Date" is converted
+    to datetime64[D] and every other field to float64, see Converter. Blank or invalid values 
+    become NaN (NaT for dates), they are dropped later by clean_data. Binary columnar files (see
+    write_binary) are loaded with load_binary.
+
+    :param f: File to read from
+    :type f: str
+    :param fields: Fields to read and return
+    :type fields: list
+    :param errors: If given, the number of blank and invalid values per field are saved in it
+    :type errors: dict
+    :raise ValueError: If fields is empty. If specified fields are missing/incorrect in the file
+        If no data was appended
+    :return: A dictionary with each field as key and a numpy array of its values as value
+    :rtype: dict
+    """
+
+    if _is_binary(f):
+        return load_binary(f, fields, errors)
+
+    columns = _read_columns(f, fields)
+    converter = Converter(columns.keys())
+
+    for field, values in columns.items():
+        columns[field] = converter.column(field, values)
+
+    if errors is not None:
+        errors.update(converter.errors)
+    return columns
+
+
+def load_columns_cached(f: str, fields: list, cache_dir: str = CACHE_DIR, max_size: int = CACHE_SIZE,
+                        errors: dict = None) -> dict:
+    """ 
+    Same as load_columns, but the parsed columns are saved to a cache (numpy .npz) so the CSV
+    file only has to be parsed again when it changes. An entry belongs to the file path and the
+    fields, and is valid as long as the size and modification time of the file are the same, or 
+    the content hash is if they're not. When the cache grows past max_size the least recently 
+    used entries are removed.
+
+    :param f: File to read from
+    :type f: str
+    :param fields: Fields to read and return
+    :type fields: list
+    :param cache_dir: Directory for the cache
+    :type cache_dir: str
+    :param max_size: Max size of the cache in bytes
+    :type max_size: int
+    :param errors: If given, the number of blank and invalid values per field are saved in it (they
+        are cached as well)
+    :type errors: dict
+    :raise ValueError: Same errors as load_columns
+    :return: A dictionary with each field as key and a numpy array of its values as value
+    :rtype: dict
+    """
+
+    # Binary columnar files load faster than the cache would
+    if _is_binary(f):
+        return load_binary(f, fields, errors)
+
+    stat = os.stat(f)
+    key = hashlib.sha256("\0".join([os.path.abspath(f), *fields]).encode()).hexdigest()
+    path = os.path.join(cache_dir, f"{key}.npz")
+
+    # Use the cached columns if the file hasn't changed
+    digest = None
+    try:
+        with np.load(path) as cached:
+            meta = json.loads(str(cached["meta"]))
+            changed = [meta["size"], meta["mtime"]] != [stat.st_size, stat.st_mtime_ns]
+            digest = _file_digest(f) if changed else meta["digest"]
+            if digest == meta["digest"]:
+                columns = {field: cached[f"column{i}"] for i, field in enumerate(meta["fields"])}
+                cached_errors = meta["errors"]
+    except (OSError, KeyError, ValueError):
+        pass
+    else:
+        if digest == meta["digest"]:
+            # Same content with a new size/mtime, remember them so the file isn't hashed next time
+            try:
+                if changed:
+                    _save_cache(path, columns, stat, digest, cached_errors)
+                else:
+                    _touch(path)
+            except OSError:
+                pass
+            if errors is not None:
+                errors.update(cached_errors)
+            return columns
+
+    # Not cached (or changed), parse the file and cache the result
+    parse_errors = {}
+    columns = load_columns(f, fields, parse_errors)
+    if errors is not None:
+        errors.update(parse_errors)
+    try:
+        _save_cache(path, columns, stat, digest or _file_digest(f), parse_errors)
+        _evict_cache(cache_dir, max_size)
+    except OSError:
+        pass
+
+    return columns
+
+
+def clear_cache(cache_dir: str = CACHE_DIR) -> int:
+    """ 
+    Remove every entry from the cache used by load_columns_cached, and the sums saved by 
+    incremental_averages.
+
+    :param cache_dir: Directory for the cache
+    :type cache_dir: str
+    :return: Number of entries removed
+    :rtype: int
+    """
+
+    removed = 0
+    for path, _, _ in _cache_entries(cache_dir):
+        try:
+            os.remove(path)
+            removed += 1
+        except FileNotFoundError:
+            pass
+    return removed
+
+
+def _save_cache(path: str, columns: dict, stat: os.stat_result, digest: str, errors: dict) -> None:
+    """ 
+    Write columns to a cache entry. The file is written next to the entry and then moved into 
+    place, so a cache entry is never half written.
+
+    :param path: Path of the cache entry
+    :type path: str
+    :param columns: Columns to save
+    :type columns: dict
+    :param stat: Stat of the CSV file when it was read
+    :type stat: os.stat_result
+    :param digest: Content hash of the CSV file
+    :type digest: str
+    :param errors: Blank and invalid values per field, see load_columns
+    :type errors: dict
+    """
+
+    meta = {
+        "fields": [*columns.keys()], "size": stat.st_size, "mtime": stat.st_mtime_ns, "digest": digest, "errors": errors
+        }
+    arrays = {f"column{i}": values for i, values in enumerate(columns.values())}
+
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp = f"{path}.{os.getpid()}.tmp"
+    with open(temp, "wb") as file:
+        np.savez(file, meta=np.array(json.dumps(meta)), **arrays)
+    os.replace(temp, path)
+    _touch(path)
+
+
+def _touch(path: str) -> None:
+    """ 
+    Mark a cache entry as used now. The time is set explicitly since the file system clock can be 
+    too coarse to tell entries used right after each other apart.
+
+    :param path: Path of the cache entry
+    :type path: str
+    """
+
+    now = time.time_ns()
+    os.utime(path, ns=(now, now))
+
+
+def _evict_cache(cache_dir: str, max_size: int) -> None:
+    """ 
+    Remove the least recently used cache entries until the cache is no larger than max_size.
+
+    :param cache_dir: Directory for the cache
+    :type cache_dir: str
+    :param max_size: Max size of the cache in bytes
+    :type max_size: int
+    """
+
+    entries = sorted(_cache_entries(cache_dir), key=lambda entry: entry[2])
+    total = sum(size for _, size, _ in entries)
+
+    for path, size, _ in entries:
+        if total <= max_size:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+
+def _cache_entries(cache_dir: str) -> list:
+    """ 
+    List the entries in the cache.
+
+    :param cache_dir: Directory for the cache
+    :type cache_dir: str
+    :return: A list of [path, size, last used (mtime)] for each entry, parsed files (.npz) and 
+        saved sums (.json, see incremental_averages)
+    :rtype: list
+    """
+
+    entries = []
+    try:
+        with os.scandir(cache_dir) as scan:
+            for entry in scan:
+                if entry.name.endswith((".npz", ".json")):
+                    stat = entry.stat()
+                    entries.append([entry.path, stat.st_size, stat.st_mtime_ns])
+    except FileNotFoundError:
+        pass
+    return entries
+
+
+def _file_digest(f: str) -> str:
+    """ 
+    Hash the content of a file.
+
+    :param f: File to hash
+    :type f: str
+    :return: The hash (hex)
+    :rtype: str
+    """
+
+    digest = hashlib.blake2b()
+    with open(f, "rb") as file:
+        while chunk := file.read(1024 * 1024):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def load_year(f: str, fields: list, year: str, errors: dict = None) -> dict:
+    """ 
+    Same as load_columns, but only the rows for one year are returned. For files sorted by date, 
+    the date index (see build_index) tells where in the file the year starts and ends, so only 
+    those rows are read and parsed. Files that aren't sorted, and binary columnar files, are read 
+    in full.
+
+    :param f: File to read from
+    :type f: str
+    :param fields: Fields to read and return, "Date" is required
+    :type fields: list
+    :param year: Year to return the rows for
+    :type year: str
+    :param errors: If given, the number of blank and invalid values per field are saved in it
+    :type errors: dict
+    :raise ValueError: Same errors as load_columns. If "Date" is not one of the fields
+    :return: A dictionary with each field as key and a numpy array of its values for the year
+    :rtype: dict
+    """
+
+    if fields == []:
+        raise ValueError("Please provide a list of fields (str)")
+
+    index = None if _is_binary(f) else build_index(f)
+
+    # Binary, not sorted (or nothing to index), read everything and keep the year
+    if index is None or not index["sorted"] or not index["months"] or "Date" not in fields:
+        columns = load_columns(f, fields, errors)
+        if "Date" not in columns:
+            raise ValueError('Missing required key "Date"')
+        keep = columns["Date"].astype("datetime64[Y]").astype(np.int64) + 1970 == int(year)
+        return {field: values[keep] for field, values in columns.items()}
+
+    spans = [span for month, span in index["months"].items() if month[:4] == year]
+    start, end = [spans[0][0], spans[-1][1]] if spans else [index["header"], index["header"]]
+
+    with open(f, "rb") as file:
+        header = file.read(index["header"]).decode("utf-8-sig")
+        positions = _field_positions(f, next(csv.reader([header]), []), fields)
+        file.seek(start)
+        data = file.read(end - start)
+
+    # Only the rows of the year are parsed
+    columns = {field: [] for field in positions}
+    appends = [values.append for values in columns.values()]
+    indexes = [*positions.values()]
+    for row in csv.reader(io.StringIO(data.decode("utf-8"))):
+        if row == []:
+            continue
+        length = len(row)
+        for append, i in zip(appends, indexes):
+            append(row[i] if i < length else None)
+
+    converter = Converter(columns.keys())
+    for field, values in columns.items():
+        columns[field] = converter.column(field, values) if values else _empty_columns([field])[field]
+
+    if errors is not None:
+        errors.update(converter.errors)
+    return columns
+
+
+def build_index(f: str) -> dict:
+    """ 
+    Index a CSV file by date: where each month ("YYYY-MM") starts and ends in the file (byte 
+    offsets), and whether the dates are in order. The index is saved next to the file (the file
+    name plus INDEX_SUFFIX) and used as long as the size and modification time of the file are 
+    the same. Rows without a valid date are left out of the index. If a date comes before the 
+    one above it, the file isn't sorted and the index only says so.
+
+    :param f: File to index
+    :type f: str
+    :raise ValueError: If the file is not a CSV or it doesn't exist, see check_csv
+    :return: A dictionary with "sorted", "header" (length in bytes) and "months" (month as key, 
+        [start, end] as value)
+    :rtype: dict
+    """
+
+    stat = os.stat(check_csv(f))
+    path = f"{f}{INDEX_SUFFIX}"
+
+    try:
+        with open(path) as file:
+            index = json.load(file)
+        if [index["size"], index["mtime"]] == [stat.st_size, stat.st_mtime_ns]:
+            return index
+    except (OSError, KeyError, TypeError, ValueError):
+        pass
+
+    index = {"size": stat.st_size, "mtime": stat.st_mtime_ns, "sorted": True, "header": 0, "months": {}}
+
+    with open(f, "rb") as file:
+        header = file.readline()
+        csv_fields = next(csv.reader([header.decode("utf-8-sig")]), [])
+        index["header"] = len(header)
+
+        if "Date" not in csv_fields:
+            index["sorted"] = False
+        else:
+            # The last one wins if a fieldname is repeated, same as _field_positions
+            date_index = len(csv_fields) - 1 - csv_fields[::-1].index("Date")
+            last = ""
+            for offset, record in _records(file, len(header)):
+                row = next(csv.reader(io.StringIO(record.decode("utf-8"))), [])
+                date = row[date_index] if date_index < len(row) else ""
+                if not Converter._DATE.fullmatch(date):
+                    continue
+                if date < last:
+                    index.update(sorted=False, months={})
+                    break
+                last = date
+                span = index["months"].setdefault(date[:7], [offset, offset])
+                span[1] = offset + len(record)
+
+    try:
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "w") as file:
+            json.dump(index, file)
+        os.replace(temp, path)
+    except OSError:
+        pass
+
+    return index
+
+
+def _records(file, offset: int):
+    """ 
+    Generator going through the rows of an open (binary) CSV file from offset, a row can be more
+    than one line if a quoted value contains a newline.
+
+    :param file: The file, positioned at offset
+    :type file: file
+    :param offset: Where in the file the first row starts
+    :type offset: int
+    :return: Generator of [offset, row (bytes)]
+    :rtype: generator
+    """
+
+    record = b""
+    for line in file:
+        record += line
+
+        # An odd number of quotes means a quoted value continues on the next line
+        if record.count(b'"') % 2:
+            continue
+        yield [offset, record]
+        offset += len(record)
+        record = b""
+
+    if record:
+        yield [offset, record]
+
+
+def write_binary(f: str, out: str = None, float32: bool = False) -> str:
+    """ 
+    Convert a CSV file to a binary columnar file, which loads without any parsing (see 
+    load_binary). Every field of the file is kept, in the same order. The file starts with MAGIC, 
+    the length of the header (uint32) and the header (JSON) with the fields, the number of rows,
+    the type and position of each column, the decimal separator used for each field in the CSV
+    and the blank/invalid value counts. Then come the columns: "Date" as int32 day numbers 
+    (days since 1970-01-01, NO_DATE if blank), the other fields in SCHEMA as float64 (or float32)
+    and fields not in SCHEMA as text ("text": where each value ends (uint64), then the values as UTF-8).
+
+    :param f: CSV file to convert
+    :type f: str
+    :param out: Where to save the file, defaults to the same name with BINARY_EXTENSION
+    :type out: str
+    :param float32: Store the values as float32, half the size but less precise
+    :type float32: bool
+    :raise ValueError: Same errors as load_columns. If no field of the file is in SCHEMA
+    :return: String displaying where file was saved
+    :rtype: str
+    """
+
+    out = out or f"{os.path.splitext(f)[0]}{BINARY_EXTENSION}"
+
+    with open(f, "r", newline="") as file:
+        fields = next(csv.reader(file), [])
+    if not any(field in SCHEMA for field in fields):
+        raise ValueError(f"{f} has none of the fields: {*SCHEMA,}")
+
+    text = _read_columns(f, fields)
+    converter = Converter(text.keys())
+    columns = {field: converter.column(field, values) for field, values in text.items()}
+
+    # The CSV is written back with the same decimal separator
+    decimal = {field: "," if any("," in value for value in values if value) else "." for field, values in text.items()}
+
+    arrays = []
+    dtypes = []
+    for field, values in columns.items():
+        if field == "Date":
+            days = values.astype(np.int64)
+            arrays.append(np.where(np.isnat(values), NO_DATE, days).astype("<i4"))
+        elif field in SCHEMA:
+            arrays.append(values.astype("<f4" if float32 else "<f8"))
+        else:
+            # Kept as text, where each value ends followed by all of them
+            encoded = [(value or "").encode() for value in text[field]]
+            ends = np.cumsum([0, *map(len, encoded)], dtype=np.int64).astype("<u8")
+            arrays.append(np.frombuffer(ends.tobytes() + b"".join(encoded), dtype=np.uint8))
+            dtypes.append("text")
+            continue
+        dtypes.append(arrays[-1].dtype.str)
+
+    # Each column starts at a multiple of 8 bytes after the header
+    offsets = []
+    position = 0
+    for values in arrays:
+        offsets.append(position)
+        position += -(-values.nbytes // 8) * 8
+
+    header = json.dumps({
+        "fields": [*columns.keys()], "rows": len(next(iter(columns.values()))),
+        "dtypes": dtypes, "offsets": offsets, "decimal": decimal, "errors": converter.errors,
+        }).encode()
+
+    temp = f"{out}.{os.getpid()}.tmp"
+    with open(temp, "wb") as file:
+        file.write(MAGIC + len(header).to_bytes(4, "little") + header)
+        file.write(b"\0" * (-file.tell() % 8))
+        start = file.tell()
+        for offset, values in zip(offsets, arrays):
+            file.write(b"\0" * (start + offset - file.tell()))
+            file.write(values.tobytes())
+    os.replace(temp, out)
+
+    return f"File saved: {out}"
+
+
+def load_binary(f: str, fields: list, errors: dict = None) -> dict:
+    """ 
+    Same as load_columns for binary columnar files from write_binary. The file is memory mapped,
+    so float64 columns are used straight from the file without being copied or parsed (float32 
+    columns and the dates are converted, and fields kept as text are converted like load_columns does).
+
+    :param f: File to read from
+    :type f: str
+    :param fields: Fields to read and return
+    :type fields: list
+    :param errors: If given, the number of blank and invalid values per field (counted when the
+        file was converted) are saved in it
+    :type errors: dict
+    :raise ValueError: Same errors as load_columns. If the file is not a binary columnar file
+    :return: A dictionary with each field as key and a numpy array of its values as value
+    :rtype: dict
+    """
+
+    if fields == []:
+        raise ValueError("Please provide a list of fields (str)")
+
+    header, start = _binary_header(f)
+    positions = _field_positions(f, header["fields"], fields)
+
+    if header["rows"] == 0:
+        raise ValueError("No data was appended")
+
+    columns = {}
+    for field, i in positions.items():
+        if header["dtypes"][i] == "text":
+            columns[field] = Converter([field]).column(field, _binary_text(f, header, start, i))
+            continue
+        values = np.memmap(f, dtype=header["dtypes"][i], mode="r", offset=start + header["offsets"][i], shape=(header["rows"],))
+        if field == "Date":
+            dates = values.astype("datetime64[D]")
+            dates[values == NO_DATE] = np.datetime64("NaT")
+            columns[field] = dates
+        else:
+            columns[field] = values if values.dtype == np.float64 else values.astype(np.float64)
+
+    if errors is not None:
+        errors.update({field: header["errors"][field] for field in positions})
+    return columns
+
+
+def export_csv(f: str, out: str = None) -> str:
+    """ 
+    Convert a binary columnar file from write_binary back to CSV, in the same layout as the file
+    it was made from: the same fields in the same order, dates as YYYY-MM-DD, blank values left
+    blank, whole numbers without decimals, the same decimal separator ("74,5") and fields not in
+    SCHEMA with their text as it was. Reading the CSV again gives the same values.
+
+    :param f: Binary columnar file
+    :type f: str
+    :param out: Where to save the CSV, defaults to the same name with .csv
+    :type out: str
+    :raise ValueError: If the file is not a binary columnar file. If out already exists and
+        wasn't given
+    :return: String displaying where file was saved
+    :rtype: str
+    """
+
+    header, start = _binary_header(f)
+    if out is None:
+        out = f"{os.path.splitext(f)[0]}.csv"
+        if os.path.exists(out):
+            raise ValueError(f"{out} already exists")
+
+    numbers = [field for field, dtype in zip(header["fields"], header["dtypes"]) if dtype != "text"]
+    columns = load_binary(f, numbers) if numbers else {}
+    text = []
+    for i, field in enumerate(header["fields"]):
+        if header["dtypes"][i] == "text":
+            text.append(_binary_text(f, header, start, i))
+            continue
+        values = columns[field]
+        if field == "Date":
+            text.append(["" if np.isnat(date) else str(date) for date in values])
+            continue
+        # Shortest text that reads back as the same value, for the type it was stored as
+        stored = np.asarray(values, dtype=header["dtypes"][header["fields"].index(field)])
+        formatted = [
+            "" if np.isnan(value) else np.format_float_positional(value, trim="-") for value in stored
+            ]
+        if header["decimal"][field] == ",":
+            formatted = [value.replace(".", ",") for value in formatted]
+        text.append(formatted)
+
+    with open(out, "w", newline="") as file:
+        writer = csv.writer(file)
+        writer.writerow(header["fields"])
+        writer.writerows(zip(*text))
+
+    return f"File saved: {out}"
+
+
+def _binary_header(f: str) -> list:
+    """ 
+    Read the header of a binary columnar file, see write_binary.
+
+    :param f: The file
+    :type f: str
+    :raise ValueError: If the file is not a binary columnar file
+    :return: A list with the header and where the columns start (bytes)
+    :rtype: list
+    """
+
+    with open(f, "rb") as file:
+        start = file.read(len(MAGIC) + 4)
+        if len(start) < len(MAGIC) + 4 or start[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"{f} is not a {BINARY_EXTENSION} file")
+        length = int.from_bytes(start[len(MAGIC):], "little")
+        header = json.loads(file.read(length))
+
+    end = len(MAGIC) + 4 + length
+    return [header, end + -end % 8]
+
+
+def _binary_text(f: str, header: dict, start: int, i: int) -> list:
+    """ 
+    Read a field kept as text from a binary columnar file, see write_binary.
+
+    :param f: The file
+    :type f: str
+    :param header: Header of the file, see _binary_header
+    :type header: dict
+    :param start: Where the columns start (bytes)
+    :type start: int
+    :param i: Position of the field
+    :type i: int
+    :return: The values (str)
+    :rtype: list
+    """
+
+    rows = header["rows"]
+    with open(f, "rb") as file:
+        file.seek(start + header["offsets"][i])
+        ends = np.frombuffer(file.read((rows + 1) * 8), dtype="<u8").astype(np.int64)
+        data = file.read(int(ends[-1]))
+    return [data[ends[row]:ends[row + 1]].decode() for row in range(rows)]
+
+
+def _is_binary(f: str) -> bool:
+    """ 
+    Check if a file is a binary columnar file, by extension.
+
+    :param f: The file
+    :type f: str
+    :return: True if it is
+    :rtype: bool
+    """
+
+    return os.path.splitext(f)[1] == BINARY_EXTENSION
+
+
+def _read_columns(f: str, fields: list) -> dict:
+    """ 
+    Read the specified fields from a CSV file into one list of str per field, in the order the
+    fields appear in the file. Rows are never turned into dictionaries.
+
+    :param f: File to read from
+    :type f: str
+    :param fields: Fields to read and return
+    :type fields: list
+    :raise ValueError: If fields is empty. If specified fields are missing/incorrect in the file
+        If no data was appended
+    :return: A dictionary with each field as key and a list of its values (str) as value
+    :rtype: dict
+    """
+
+    rows = _iter_rows(f, fields)
+
+    # The first item is the kept fieldnames
+    columns = {field: [] for field in next(rows)}
+    appends = [values.append for values in columns.values()]
+
+    for row in rows:
+        for append, value in zip(appends, row):
+            append(value)
+
+    return columns
+
+
+def _iter_rows(f: str, fields: list):
+    """ 
+    Generator reading the specified fields from a CSV file one row at a time. The first item
+    yielded is the list of kept fieldnames (in the order they appear in the file), followed by
+    one tuple of values (str) per row.
+
+    :param f: File to read from
+    :type f: str
+    :param fields: Fields to read and return
+    :type fields: list
+    :raise ValueError: If fields is empty. If specified fields are missing/incorrect in the file
+        If no data was appended
+    :return: Generator of fieldnames, then rows
+    :rtype: generator
+    """
+
+    if fields == []:
+        raise ValueError("Please provide a list of fields (str)")
+
+    with open(f, "r", newline="") as file:
+        reader = csv.reader(file)
+
+        # Get fieldnames
+        positions = _field_positions(f, next(reader, []), fields)
+        indexes = [*positions.values()]
+        yield [*positions.keys()]
+
+        # Go through the csv and only yield the values of the included fields
+        appended = False
+        for row in reader:
+            if row == []:
+                continue
+            length = len(row)
+            yield tuple(row[i] if i < length else None for i in indexes)
+            appended = True
+
+    if not appended:
+        raise ValueError("No data was appended")
+
+
+def _field_positions(f: str, csv_fields: list, fields: list) -> dict:
+    """ 
+    Find the column index of each field to keep.
+
+    :param f: File the fieldnames are from
+    :type f: str
+    :param csv_fields: Fieldnames in the file
+    :type csv_fields: list
+    :param fields: Fields to keep
+    :type fields: list
+    :raise ValueError: If specified fields are missing/incorrect in the file
+    :return: A dictionary with the field as key and its column index as value, in file order
+    :rtype: dict
+    """
+
+    file_name = os.path.split(f)
+    missing_fields = []
+
+    # Check that the included fields are present, otherwise exit
+    for field in fields:
+        if field not in csv_fields:
+            missing_fields.append(field)
+    if missing_fields != []:
+       raise ValueError(f'{*missing_fields,} field(s) missing/incorrect in: "{file_name[1]}"')
+
+    # The last one wins if a fieldname is repeated
+    return {field: i for i, field in enumerate(csv_fields) if field in fields}
+
+
+class Converter:
+    """ 
+    Converts values from the CSV files following a schema, see SCHEMA. The schema is compiled 
+    once, into one function per column converting a single value (used by row) and one function
+    per column converting a whole column (column). Values that can't be converted are counted per column in errors, as "blank" (empty 
+    or missing) or "invalid" (anything else that isn't a date or number), failed is the first
+    column that couldn't be converted in the last row and reason why ("blank" or "invalid"). 
+    Invalid numbers in a column are INVALID, blank ones NaN.
+
+    Column types are "date" (YYYY-MM-DD, kept as str for rows and datetime64[D] for columns, 
+    anything else datetime.strptime accepts for it, like "2023-3-5", is converted to it) and 
+    "number" (float) with "decimal" being ".", "," or "either" for the decimal separator.
+
+    :param names: Columns, in the order the values come in
+    :type names: list
+    :param schema: Column types, columns not in it use DEFAULT_COLUMN
+    :type schema: dict
+    :raise ValueError: If a column type or decimal separator is unknown
+    """
+
+    _DECIMALS = {".": ".", ",": ",", "either": ".,"}
+    _DATE = re.compile(r"\d{4}-\d{2}-\d{2}")
+
+    def __init__(self, names: list, schema: dict = None):
+        schema = SCHEMA if schema is None else schema
+
+        self.names = [*names]
+        self.errors = {name: {"blank": 0, "invalid": 0} for name in self.names}
+        self.failed = None
+        self.reason = None
+        self._parsers = []
+        self._columns = {}
+
+        # One function per column for single values and one for whole columns
+        for name in self.names:
+            column = schema.get(name, DEFAULT_COLUMN)
+            if column["type"] == "date":
+                self._parsers.append(self._date(self._DATE.fullmatch))
+                self._columns[name] = self._date_column
+            elif column["type"] == "number" and column.get("decimal", "either") in self._DECIMALS:
+                separators = self._DECIMALS[column.get("decimal", "either")]
+                separator = f"[{re.escape(separators)}]"
+                pattern = re.compile(rf"[ \t]*[+-]?(?:\d+(?:{separator}\d*)?|{separator}\d+)[ \t]*")
+                parse = self._number(pattern, "," in separators)
+                self._parsers.append(parse)
+                self._columns[name] = self._number_column(separators, parse)
+            else:
+                raise ValueError(f"Unknown column type for {name}: {column}")
+
+    def row(self, values: list) -> list:
+        """ 
+        Convert the values of one row, in the same order as names.
+
+        :param values: Values from the CSV (str, None if missing)
+        :type values: list
+        :return: The converted values, None if any of them couldn't be converted
+        :rtype: list
+        """
+
+        converted = [parse(value) for parse, value in zip(self._parsers, values)]
+        if None not in converted:
+            return converted
+
+        # Count every value that couldn't be converted
+        self.failed = None
+        for name, value, result in zip(self.names, values, converted):
+            if result is None:
+                reason = "blank" if value is None or value.strip() == "" else "invalid"
+                self.errors[name][reason] += 1
+                if self.failed is None:
+                    self.failed, self.reason = name, reason
+        return None
+
+    def column(self, name: str, values: list) -> np.ndarray:
+        """ 
+        Convert all the values of one column. Values that can't be converted become NaN, INVALID
+        if they aren't blank (NaT for dates).
+
+        :param name: The column
+        :type name: str
+        :param values: Values from the CSV (str, None if missing)
+        :type values: list
+        :return: Array of dates (datetime64[D]) or numbers (float64)
+        :rtype: np.ndarray
+        """
+
+        converted, blank = self._columns[name](values)
+        failed = int(np.isnat(converted).sum() if converted.dtype.kind == "M" else np.isnan(converted).sum())
+        self.errors[name]["blank"] += blank
+        self.errors[name]["invalid"] += failed - blank
+        return converted
+
+    @staticmethod
+    def _date_column(values: list) -> list:
+        """ 
+        Convert a column of dates, see column.
+
+        :param values: Dates (YYYY-MM-DD)
+        :type values: list
+        :return: A list with the array of dates and the number of blank values
+        :rtype: list
+        """
+
+        blank = sum(1 for value in values if value is None or value.strip() == "")
+        return [_to_dates([value or "NaT" for value in values]), blank]
+
+    @staticmethod
+    def _date(match):
+        """ 
+        Compile the function checking a single date, see row.
+
+        :param match: Function matching a whole date, see _DATE
+        :type match: function
+        :return: Function returning the date as YYYY-MM-DD (str), None if it's not a date
+        :rtype: function
+        """
+
+        def parse(value: str) -> str:
+            if value and match(value):
+                try:
+                    datetime.fromisoformat(value)
+                    return value
+                except ValueError:
+                    return None
+            return _parse_date(value)
+
+        return parse
+
+    @staticmethod
+    def _number(pattern: re.Pattern, comma: bool):
+        """ 
+        Compile the function converting a single number, see row. Whole numbers, the most common
+        values, are converted right away without checking the pattern.
+
+        :param pattern: What a number looks like
+        :type pattern: re.Pattern
+        :param comma: If "," may be used as decimal separator
+        :type comma: bool
+        :return: Function returning the value as a float, None if it's not a number
+        :rtype: function
+        """
+
+        match = pattern.fullmatch
+
+        def parse(value: str) -> float:
+            if value and value.isdecimal():
+                return float(value)
+            if value is None or not match(value):
+                return None
+            return float(value.replace(",", ".")) if comma else float(value)
+
+        return parse
+
+    @staticmethod
+    def _number_column(separators: str, parse):
+        """ 
+        Compile the function converting a column of numbers, see column. If the column only 
+        contains digits, signs, spaces and the decimal separators, float converts every value in 
+        one go (it accepts exactly the same numbers as the pattern for those characters), 
+        otherwise the values are converted one by one.
+
+        :param separators: Decimal separators, see SCHEMA
+        :type separators: str
+        :param parse: Function converting a single value, see _number
+        :type parse: function
+        :return: Function returning a list with the array of numbers and the number of blank values
+        :rtype: function
+        """
+
+        allowed = str.maketrans("", "", f"0123456789+- \t\n{separators}")
+        comma = "," in separators
+
+        def convert(values: list) -> list:
+            try:
+                text = "\n".join(values)
+            except TypeError:
+                text = "\n".join(value or "" for value in values)
+
+            if values and text.count("\n") == len(values) - 1 and not text.translate(allowed):
+                # Blank values (empty lines) become "nan", twice since the replaced lines overlap
+                text = f"\n{text.replace(',', '.') if comma else text}\n"
+                text = text.replace("\n\n", "\nnan\n").replace("\n\n", "\nnan\n")
+                try:
+                    converted = np.fromiter(map(float, text[1:-1].split("\n")), np.float64, len(values))
+                    return [converted, text.count("nan")]
+                except ValueError:
+                    pass
+
+            blanks = [value is None or value.strip() == "" for value in values]
+            converted = [parse(value) for value in values]
+            converted = [(np.nan if is_blank else INVALID) if number is None else number for number, is_blank in zip(converted, blanks)]
+            return [np.array(converted, dtype=np.float64), sum(blanks)]
+
+        return convert
+
+
+def _to_dates(values: list) -> np.ndarray:
+    """ 
+    Convert a list of dates (YYYY-MM-DD, or see _parse_date) to a datetime64[D] array, invalid
+    dates become NaT.
+
+    :param values: List of dates (str)
+    :type values: list
+    :return: Array of dates
+    :rtype: np.ndarray
+    """
+
+    # numpy also takes shorter dates ("2023-03" is 2023-03-01), those are left to the one by one check
+    try:
+        dates = np.array(values, dtype="datetime64[D]")
+        if all(len(value) == 10 or value == "NaT" for value in values):
+            return dates
+    except ValueError:
+        pass
+
+    # At least one date is invalid or in another form, convert them one by one instead
+    dates = np.full(len(values), np.datetime64("NaT"), dtype="datetime64[D]")
+    for i, value in enumerate(values):
+        value = _parse_date(value)
+        if value is not None:
+            dates[i] = np.datetime64(value, "D")
+    return dates
+
+
+def _parse_date(value: str) -> str:
+    """ 
+    Check a date the same way datetime.strptime with "%Y-%m-%d" does, so "2023-3-5" is a date 
+    as well.
+
+    :param value: The date
+    :type value: str
+    :return: The date as YYYY-MM-DD, None if it's not a date
+    :rtype: str
+    """
+
+    try:
+        return datetime.strptime(value, r"%Y-%m-%d").date().isoformat()
+    except (ValueError, TypeError):
+        return None
+
+
+def clean_data(data: list, year: str, stats: dict = None) -> list:
+    """ 
+    Clean data from list of dictionaries using year to limit what data to clean and return.
+    The key "Date" containing the date (YYYY-MM-DD) is required. Converts str values to float 
+    (see Converter) and omits entries that have atleast one empty or invalid value, the input is
+    left as it is. Columns from load_columns are also accepted, in which case columns are returned.
+
+    :param data: List of dictionaries (or dictionary of columns) to clean
+    :type data: list
+    :param year: Year to limit what to clean and return, None keeps the rows of every year
+    :type year: str
+    :param stats: If given, the number of rows read ("rows_read"), rows from other years 
+        ("rows_other_years"), rows dropped per field that was blank or not a number and why 
+        ("rows_dropped", the first such field of the row, {"blank": ..., "invalid": ...}) and rows 
+        kept ("rows_kept") are saved in it
+    :type stats: dict
+    :raise ValueError: If key "Date" missing. If there are no entries for given year. 
+        Data input contains no values for some or all fields.
+    :return: A list of dictionaries with dates corresponding to the given year, containing the 
+        fields (keys) provided in the list of dictionaries with their values converted to float.
+    :rtype: list
+    """
+
+    if isinstance(data, dict):
+        return _clean_columns(data, year, stats)
+
+    data_year = []
+    fields = data[0].keys()
+    cleaned_data = []
+    dropped = {}
+
+    if "Date" not in fields:
+        raise ValueError('Missing required key "Date"')
+
+    for row in data:
+        # Only append if the date is from the given year
+        if row["Date"] is not None and (year is None or row["Date"][:4] == year):
+            data_year.append(row)
+
+    if stats is not None:
+        stats.update(rows_read=len(data), rows_other_years=len(data) - len(data_year), rows_dropped=dropped)
+    
+    if data_year == []:
+        raise ValueError(f"Data contains no entries for {year}" if year else "Data contains no entries")
+    
+    # Convert each row in one step, into new dictionaries
+    converter = Converter(fields)
+    for row in data_year:
+        values = converter.row([row[field] for field in fields])
+        if values is not None:
+            cleaned_data.append(dict(zip(fields, values)))
+        else:
+            reasons = dropped.setdefault(converter.failed, {"blank": 0, "invalid": 0})
+            reasons[converter.reason] += 1
+
+    if stats is not None:
+        stats["rows_kept"] = len(cleaned_data)
+
+    # If not data was appended show message and exit, otherwise return the data
+    if cleaned_data == []:
+        raise ValueError(f'Data input contains no values for some or all of the following: {*fields,}')
+    else:
+        return cleaned_data
+
+
+def _clean_columns(data: dict, year: str, stats: dict = None) -> dict:
+    """ 
+    Columnar version of clean_data. Keeps the rows for the given year that have a value for every
+    field, the arrays are filtered with masks instead of row by row.
+
+    :param data: Dictionary of columns from load_columns
+    :type data: dict
+    :param year: Year to limit what to clean and return, None keeps the rows of every year
+    :type year: str
+    :param stats: Row counts are saved in it if given, see clean_data
+    :type stats: dict
+    :raise ValueError: If key "Date" missing. If there are no entries for given year. 
+        Data input contains no values for some or all fields.
+    :return: A dictionary of columns only containing the rows for the given year without blanks
+    :rtype: dict
+    """
+
+    fields = data.keys()
+
+    if "Date" not in fields:
+        raise ValueError('Missing required key "Date"')
+
+    # Only keep the rows where the year of the date is the given year (or that have a date)
+    if year is None:
+        keep = ~np.isnat(data["Date"])
+    else:
+        keep = data["Date"].astype("datetime64[Y]").astype(np.int64) + 1970 == int(year)
+    dropped = {}
+
+    if stats is not None:
+        stats.update(rows_read=len(keep), rows_other_years=int(len(keep) - keep.sum()), rows_dropped=dropped)
+
+    if not keep.any():
+        raise ValueError(f"Data contains no entries for {year}" if year else "Data contains no entries")
+
+    # Skip the rows with at least one blank (or invalid) value, counted for the first such field of the row
+    for field in fields:
+        if field != "Date":
+            blank = keep & np.isnan(data[field])
+            if blank.any():
+                invalid = int((blank & (np.asarray(data[field], dtype=np.float64).view(np.int64) == INVALID_BITS)).sum())
+                dropped[field] = {"blank": int(blank.sum()) - invalid, "invalid": invalid}
+            keep &= ~blank
+
+    if stats is not None:
+        stats["rows_kept"] = int(keep.sum())
+
+    if not keep.any():
+        raise ValueError(f'Data input contains no values for some or all of the following: {*fields,}')
+
+    return {field: values[keep] for field, values in data.items()}
+    
+
+def join_data(left: dict, right: dict, how: str = "inner", lag: int = 0, year: str = None) -> dict:
+    """ 
+    Join two dictionaries of columns (see clean_data) by date, into one dictionary with "Date" and
+    the fields of both. With a lag, the rows of right dated lag days after a row of left are joined
+    to it (lag=7 joins each day's macros with the weight a week later), the joined row has the date
+    of left. Both are sorted by date (kept as they are if they already are) and merged in one 
+    pass, a date found in several rows of one of them is joined with every row of that date in 
+    the other. The result can be averaged with average_data like the columns of a single file.
+
+    :param left: Dictionary of columns, "Date" as datetime64
+    :type left: dict
+    :param right: Dictionary of columns, "Date" as datetime64
+    :type right: dict
+    :param how: "inner" only keeps the dates found in both, "outer" keeps every date, with NaN for
+        the fields of the one missing the date
+    :type how: str
+    :param lag: Number of days the dates of right are after the dates of left
+    :type lag: int
+    :param year: Only keep the joined rows dated in this year
+    :type year: str
+    :raise ValueError: If how isn't "inner" or "outer", or a field other than "Date" is in both
+    :return: A dictionary of columns sorted by date
+    :rtype: dict
+    """
+
+    if how not in ("inner", "outer"):
+        raise ValueError(f'Join must be "inner" or "outer", not {how!r}')
+    for field in left.keys():
+        if field != "Date" and field in right:
+            raise ValueError(f'Field "{field}" is in both, it can only be joined from one of them')
+
+    # Sort each by date, unless already sorted
+    left_order, left_days = _date_order(left["Date"])
+    right_order, right_days = _date_order(right["Date"])
+
+    # Stable sort of the two sorted runs is a linear merge (timsort), left rows come first for each date
+    keys = np.concatenate([left_days, right_days - lag])
+    order = np.argsort(keys, kind="stable")
+    keys = keys[order]
+    from_left = np.r_[0, np.cumsum(order < len(left_days))]
+
+    # Each group of equal dates, and how many of its rows come from left and right
+    starts = np.flatnonzero(np.r_[True, keys[1:] != keys[:-1]]) if len(keys) else np.zeros(0, dtype=np.int64)
+    ends = np.r_[starts[1:], len(keys)].astype(np.int64)
+    lefts = from_left[ends] - from_left[starts]
+    rights = ends - starts - lefts
+
+    # Number of joined rows for each date, every row of left with every row of right
+    if how == "inner":
+        sizes = lefts * rights
+    else:
+        sizes = np.maximum(lefts, 1) * np.maximum(rights, 1)
+    if year is not None:
+        sizes[keys[starts].astype("datetime64[D]").astype("datetime64[Y]").astype(np.int64) + 1970 != int(year)] = 0
+
+    # Position in the merged rows of the left and right row of each joined row, a date missing from
+    # one of them points at a row of the other and is left as NaN
+    group = np.repeat(np.arange(len(starts)), sizes)
+    within = np.arange(len(group)) - np.repeat(np.cumsum(sizes) - sizes, sizes)
+    width = np.maximum(rights, 1)[group]
+    last = max(len(keys) - 1, 0)
+    left_rows = order[np.minimum(starts[group] + within // width, last)]
+    right_rows = order[np.minimum(starts[group] + lefts[group] + within % width, last)] - len(left_days)
+
+    joined = {"Date": keys[starts][group].astype("datetime64[D]")}
+    for data, data_order, rows, found in [[left, left_order, left_rows, lefts[group] > 0],
+                                           [right, right_order, right_rows, rights[group] > 0]]:
+        rows = rows[found] if data_order is None else data_order[rows[found]]
+        for field, values in data.items():
+            if field != "Date":
+                joined[field] = np.full(len(group), np.nan)
+                joined[field][found] = values[rows]
+
+    return joined
+
+
+def _date_order(dates: np.ndarray) -> list:
+    """ 
+    Dates as days since 1970-01-01, sorted, and the order that sorts them (None if they already were).
+
+    :param dates: Dates as datetime64
+    :type dates: np.ndarray
+    :return: A list with the order (or None) and the sorted days
+    :rtype: list
+    """
+
+    days = dates.astype("datetime64[D]").astype(np.int64)
+    if (days[1:] >= days[:-1]).all():
+        return [None, days]
+    order = np.argsort(days, kind="stable")
+    return [order, days[order]]
+
+
+def average_data(data: list, quantiles: bool = False) -> dict:
+    """ 
+    Averages the data from a list of dictionaries, returning a dictionary. The new dictionary will
+    omit the key "Date" (used only to collect and store averages for a given month). Each of the other
+    keys' values will be another dictionary, containing the month as key and average as value. The key 
+    "Date" containing the date (YYYY-MM-DD) is required. 
+
+    :param data: A list of dictionaries (or dictionary of columns)
+    :type data: list
+    :param quantiles: Also add the quantiles in QUANTILES for each key and month, as the keys 
+        "<key> (p10)", "<key> (median)" and "<key> (p90)" after each key, see QuantileEstimator
+    :type quantiles: bool
+    :return: A dictionary containing each key (except "Date"), with the values being a dictionary of
+        the months and their average.
+    :rtype: dict
+    """
+
+    if isinstance(data, dict):
+        return _average_columns(data, quantiles)
+
+    # Parse each date once, then average every field in one go as columns
+    return _average_columns(_row_columns(data), quantiles)
+
+
+def _row_columns(data: list) -> dict:
+    """ 
+    Convert cleaned rows (see clean_data) to a dictionary of columns, "Date" as datetime64.
+
+    :param data: A list of dictionaries with "Date" and float values
+    :type data: list
+    :raise ValueError: If a date isn't in the YYYY-MM-DD format
+    :return: A dictionary of columns
+    :rtype: dict
+    """
+
+    # Remove "Date" from fields so it won't try to average the dates
+    fields = [*data[0].keys()]
+    fields.remove("Date")
+
+    dates = [row["Date"] for row in data]
+    columns = {"Date": _to_dates(dates)}
+    if np.isnat(columns["Date"]).any():
+        bad_date = dates[int(np.flatnonzero(np.isnat(columns["Date"]))[0])]
+        raise ValueError(f"time data {bad_date!r} does not match format '%Y-%m-%d'")
+
+    for field in fields:
+        columns[field] = np.array([row[field] for row in data], dtype=np.float64)
+
+    return columns
+
+
+def _average_columns(data: dict, quantiles: bool = False) -> dict:
+    """ 
+    Columnar version of average_data. Every date is converted to a month index once, then the 
+    values of each field are put in one group per month with a single bincount and stable sort. 
+    Each group is summed exactly (see _exact_sum), so the averages are identical to statistics.mean.
+    NaN values are left out of the average. Months are in chronological order.
+
+    :param data: Dictionary of columns, "Date" as datetime64
+    :type data: dict
+    :param quantiles: Also add the quantiles of each field and month, see average_data
+    :type quantiles: bool
+    :return: A dictionary containing each key (except "Date"), with the values being a dictionary of
+        the months and their average.
+    :rtype: dict
+    """
+
+    fields = [field for field in data.keys() if field != "Date"]
+    if fields == []:
+        return {}
+
+    # Month index 0-11 for each row
+    months = data["Date"].astype("datetime64[M]").astype(np.int64) % 12
+
+    averages = {}
+    for field in fields:
+        # Values of each month in the order of the rows, the same order stream_averages adds them in
+        groups = {month: values for month, values in enumerate(_group_values(months, data[field], 12)) if len(values)}
+        averages[field] = {MONTHS[month]: round(float(_exact_sum(values) / len(values)), 1) for month, values in groups.items()}
+
+        if quantiles:
+            estimators = {}
+            for month, values in groups.items():
+                estimators[month + 1] = QuantileEstimator(QUANTILES.values())
+                estimators[month + 1].extend(values)
+            averages.update(_quantile_results(field, estimators))
+
+    return averages
+
+
+def _group_values(bins: np.ndarray, values: np.ndarray, size: int) -> list:
+    """ 
+    Split the values (NaN left out) into one group per bin, each in the order of the rows. 
+
+    :param bins: Bin of each row, 0 to size - 1
+    :type bins: np.ndarray
+    :param values: Value of each row
+    :type values: np.ndarray
+    :param size: Number of bins
+    :type size: int
+    :return: An array of values per bin, empty if the bin has none
+    :rtype: list
+    """
+
+    valid = ~np.isnan(values)
+    order = np.argsort(bins[valid], kind="stable")
+    ends = np.cumsum(np.bincount(bins[valid], minlength=size))
+    return np.split(values[valid][order], ends[:-1])
+
+
+def _exact_sum(values: np.ndarray) -> Fraction:
+    """ 
+    Exact sum of floats, so a mean from it is rounded only once, like statistics.mean. math.fsum 
+    gives the sum rounded to a float, what that leaves out is summed the same way, and so on 
+    until nothing is left (usually after one or two rounds).
+
+    :param values: Values to sum
+    :type values: np.ndarray
+    :return: The sum
+    :rtype: Fraction
+    """
+
+    values = values.tolist()
+    parts = []
+    rest = math.fsum(values)
+    while rest:
+        parts.append(rest)
+        rest = math.fsum(values + [-part for part in parts])
+    return sum(map(Fraction, parts), Fraction(0))
+
+
+def _quantile_results(field: str, estimators: dict) -> dict:
+    """ 
+    The quantiles of a field per month, with the keys average_data uses for them.
+
+    :param field: Field the quantiles are for
+    :type field: str
+    :param estimators: A QuantileEstimator per month (1-12)
+    :type estimators: dict
+    :return: A dictionary with "<field> (<quantile>)" for each quantile in QUANTILES as keys, and
+        dictionaries of the months and their quantile as values
+    :rtype: dict
+    """
+
+    results = {month: estimators[month].result() for month in sorted(estimators)}
+    return {
+        f"{field} ({name})": {MONTHS[month - 1]: round(values[i], 1) for month, values in results.items()}
+        for i, name in enumerate(QUANTILES)
+        }
+
+
+def window_averages(data: list, window="month", quantiles: bool = False) -> dict:
+    """ 
+    Same as average_data, with other windows than calendar months: "day", "week" (ISO weeks,
+    Monday to Sunday) or "month", or a number of days for a rolling average ending on each day. 
+    Rows are put in one bin per day or week with a single bincount, each bin is summed exactly
+    (see _exact_sum), and a rolling average is the difference of two running sums (sum and count) 
+    per day, so the cost doesn't depend on the size of the window. NaN values are left out of the average.
+
+    :param data: A list of dictionaries (or dictionary of columns), see average_data
+    :type data: list
+    :param window: "day", "week", "month" or the number of days of a rolling average
+    :type window: str
+    :param quantiles: Also add the quantiles of each field and month, see average_data. Only for months
+    :type quantiles: bool
+    :raise ValueError: If the window isn't one of the above, or quantiles are asked for other windows
+    :return: A dictionary containing each key (except "Date"), with the values being a dictionary
+        of the windows and their average, in chronological order. Days are labeled YYYY-MM-DD 
+        (rolling averages with the last day of the window), weeks YYYY-Www and months as in average_data.
+    :rtype: dict
+    """
+
+    if window not in ("day", "week", "month") and not (isinstance(window, int) and window > 0):
+        raise ValueError(f'Window must be "day", "week", "month" or a number of days above 0, not {window!r}')
+    if window == "month":
+        return average_data(data, quantiles)
+    if quantiles:
+        raise ValueError("Quantiles are only calculated per month")
+    if not isinstance(data, dict):
+        data = _row_columns(data)
+
+    fields = [field for field in data.keys() if field != "Date"]
+    if fields == [] or len(data["Date"]) == 0:
+        return {field: {} for field in fields}
+
+    # Day (or Monday of the ISO week) of each row, counted from the first one, 1970-01-01 was a Thursday
+    days = data["Date"].astype("datetime64[D]").astype(np.int64)
+    step = 7 if window == "week" else 1
+    if window == "week":
+        days = days - (days + 3) % 7
+    first = int(days.min())
+    bins = (days - first) // step
+    size = int(bins.max()) + 1
+
+    labels = _window_labels(first, size, window)
+
+    averages = {}
+    for field in fields:
+        groups = _group_values(bins, data[field], size)
+        sums = [_exact_sum(values) for values in groups]
+        counts = [len(values) for values in groups]
+
+        # Running sums, the window ending on each day is the difference of two of them
+        if isinstance(window, int):
+            sums = [Fraction(0), *accumulate(sums)]
+            counts = [0, *accumulate(counts)]
+            starts = [max(day + 1 - window, 0) for day in range(size)]
+            sums = [sums[day + 1] - sums[start] for day, start in enumerate(starts)]
+            counts = [counts[day + 1] - counts[start] for day, start in enumerate(starts)]
+
+        averages[field] = {labels[i]: round(float(sums[i] / counts[i]), 1) for i in range(size) if counts[i]}
+
+    return averages
+
+
+def _window_labels(first: int, size: int, window) -> list:
+    """ 
+    Labels of the windows for window_averages.
+
+    :param first: Day (days since 1970-01-01) the first window starts on, or ends on for rolling averages
+    :type first: int
+    :param size: Number of windows
+    :type size: int
+    :param window: "day", "week" or the number of days of a rolling average
+    :type window: str
+    :return: YYYY-MM-DD for days, YYYY-Www for ISO weeks
+    :rtype: list
+    """
+
+    if window == "week":
+        mondays = (first + 7 * np.arange(size)).astype("datetime64[D]").tolist()
+        return [f"{year}-W{week:02d}" for year, week, _ in (monday.isocalendar() for monday in mondays)]
+    return np.datetime_as_string(first + np.arange(size).astype("datetime64[D]")).tolist()
+
+
+def stream_averages(f: str, fields: list, year: str, quantiles: bool = False) -> dict:
+    """ 
+    Same result as collect_data, clean_data and average_data in one pass over the CSV file. Rows
+    are filtered by year and cleaned as they are read, and only a running sum and count is kept
+    for each field and month, so memory doesn't grow with the size of the file. The sums are kept
+    exact so the averages are identical to statistics.mean. Quantiles are estimated as the rows
+    are read as well (see QuantileEstimator), so they don't need every value either.
+
+    :param f: File to read from
+    :type f: str
+    :param fields: Fields to read, "Date" is required
+    :type fields: list
+    :param year: Year to average data for
+    :type year: str
+    :param quantiles: Also add the quantiles of each field and month, see average_data
+    :type quantiles: bool
+    :raise ValueError: Same errors, with the same messages, as collect_data and clean_data
+    :return: A dictionary containing each field (except "Date"), with the values being a dictionary 
+        of the months and their average.
+    :rtype: dict
+    """
+
+    # Binary columnar files are already parsed, nothing to stream
+    if _is_binary(f):
+        return average_data(clean_data(load_binary(f, fields), year), quantiles)
+
+    rows = _iter_rows(f, fields)
+    names = next(rows)
+
+    # collect_data would complain about an empty file before clean_data about a missing "Date"
+    if "Date" not in names:
+        next(rows)
+        raise ValueError('Missing required key "Date"')
+
+    date_index = names.index("Date")
+    value_fields = [(i, field) for i, field in enumerate(names) if field != "Date"]
+    converter = Converter(names)
+
+    # Running [sum, count] per field, per month (1-12), and the quantile estimators if asked for
+    totals = {field: {} for _, field in value_fields}
+    estimators = {field: {} for _, field in value_fields}
+    in_year = False
+    cleaned_any = False
+
+    for row in rows:
+        # Only use the rows where the given year is in the "Date" field
+        date = row[date_index]
+        if date is None or date[:4] != year:
+            continue
+        in_year = True
+
+        # Skip the row if any of the values are empty
+        cleaned = converter.row(row)
+        if cleaned is None:
+            continue
+        cleaned_any = True
+
+        month = datetime.strptime(cleaned[date_index], r"%Y-%m-%d").month
+        for i, field in value_fields:
+            total = totals[field].setdefault(month, [{}, 0])
+            _add_exact(total[0], cleaned[i])
+            total[1] += 1
+            if quantiles:
+                if month not in estimators[field]:
+                    estimators[field][month] = QuantileEstimator(QUANTILES.values())
+                estimators[field][month].add(cleaned[i])
+
+    if not in_year:
+        raise ValueError(f"Data contains no entries for {year}")
+    if not cleaned_any:
+        raise ValueError(f'Data input contains no values for some or all of the following: {*names,}')
+
+    averages = {}
+    for field, months in totals.items():
+        averages[field] = {MONTHS[month - 1]: round(_exact_mean(*months[month]), 1) for month in sorted(months)}
+        if quantiles:
+            averages.update(_quantile_results(field, estimators[field]))
+
+    return averages
+
+
+def _add_exact(partials: dict, value: float) -> None:
+    """ 
+    Add a float to an exact running sum. The sum is stored as numerators per (power of two) 
+    denominator, the same way statistics.mean sums its values.
+
+    :param partials: Running sum, denominator as key and sum of numerators as value
+    :type partials: dict
+    :param value: Value to add
+    :type value: float
+    """
+
+    numerator, denominator = float(value).as_integer_ratio()
+    partials[denominator] = partials.get(denominator, 0) + numerator
+
+
+def _exact_mean(partials: dict, count: int) -> float:
+    """ 
+    Mean of an exact running sum from _add_exact, rounded to the nearest float just like
+    statistics.mean.
+
+    :param partials: Running sum from _add_exact
+    :type partials: dict
+    :param count: Number of values added to the sum
+    :type count: int
+    :return: The mean
+    :rtype: float
+    """
+
+    return float(sum(Fraction(numerator, denominator) for denominator, numerator in partials.items()) / count)
+
+
+class QuantileEstimator:
+    """ 
+    Estimates quantiles of the values added to it, one at a time, without keeping them all. The 
+    first exact values are kept and the quantiles are calculated exactly from them (the same as
+    numpy.quantile). After that each quantile is estimated with the P² algorithm (Jain & Chlamtac),
+    which only keeps five markers per quantile: the min, the max, the quantile and two points 
+    halfway to it, moved towards where they should be as values are added.
+
+    :param probs: Quantiles to estimate, 0-1
+    :type probs: list
+    :param exact: Number of values kept to calculate the quantiles exactly (at least 5), defaults
+        to EXACT_QUANTILES
+    :type exact: int
+    """
+
+    def __init__(self, probs: list, exact: int = None):
+        self.probs = list(probs)
+        self.exact = max(exact or EXACT_QUANTILES, 5)
+        self.count = 0
+        self._values = []
+
+        # Per quantile: marker heights, positions, desired positions and how much those grow per value
+        self._markers = None
+
+    def add(self, value: float) -> None:
+        """ 
+        Add a value.
+
+        :param value: Value to add
+        :type value: float
+        """
+
+        self.count += 1
+        if self._markers is None:
+            self._values.append(value)
+            if self.count > self.exact:
+                self._start()
+            return
+
+        for heights, positions, desired, increments in self._markers:
+            # Marker cell the value falls in, the min and max are moved if it's outside them
+            if value < heights[0]:
+                heights[0] = value
+                cell = 0
+            elif value >= heights[4]:
+                heights[4] = value
+                cell = 3
+            else:
+                cell = 0
+                while value >= heights[cell + 1]:
+                    cell += 1
+
+            for i in range(cell + 1, 5):
+                positions[i] += 1
+            for i in range(5):
+                desired[i] += increments[i]
+
+            # Move the middle markers one position towards where they should be, if there's room
+            for i in (1, 2, 3):
+                off = desired[i] - positions[i]
+                if (off >= 1 and positions[i + 1] - positions[i] > 1) or (off <= -1 and positions[i - 1] - positions[i] < -1):
+                    step = 1 if off > 0 else -1
+                    height = self._parabolic(heights, positions, i, step)
+                    if not heights[i - 1] < height < heights[i + 1]:
+                        height = heights[i] + step * (heights[i + step] - heights[i]) / (positions[i + step] - positions[i])
+                    heights[i] = height
+                    positions[i] += step
+
+    def extend(self, values) -> None:
+        """ 
+        Add several values, in order.
+
+        :param values: Values to add
+        :type values: list
+        """
+
+        for value in values:
+            self.add(float(value))
+
+    def result(self) -> list:
+        """ 
+        The quantiles of the values added so far.
+
+        :return: One value per quantile, in the same order as probs (NaN if no values were added)
+        :rtype: list
+        """
+
+        if self._markers is not None:
+            return [heights[2] for heights, _, _, _ in self._markers]
+        if self._values == []:
+            return [float("nan")] * len(self.probs)
+        return np.quantile(self._values, self.probs).tolist()
+
+    def _start(self) -> None:
+        """ 
+        Switch from exact to estimated quantiles, placing the markers of each quantile at the values
+        (sorted) closest to where they should be.
+        """
+
+        values = sorted(self._values)
+        last = len(values) - 1
+        self._markers = []
+        for p in self.probs:
+            desired = [0.0, last * p / 2, last * p, last * (1 + p) / 2, float(last)]
+            positions = [0]
+            for i in (1, 2, 3):
+                positions.append(min(max(round(desired[i]), positions[-1] + 1), last - 4 + i))
+            positions.append(last)
+
+            # Positions are counted from 1 in the algorithm
+            self._markers.append([
+                [values[position] for position in positions], [position + 1 for position in positions], 
+                [position + 1 for position in desired], [0.0, p / 2, p, (1 + p) / 2, 1.0],
+                ])
+        self._values = []
+
+    @staticmethod
+    def _parabolic(heights: list, positions: list, i: int, step: int) -> float:
+        """ 
+        New height of marker i when moved step (1 or -1) positions, from the parabola through it 
+        and its neighbours.
+        """
+
+        return heights[i] + step / (positions[i + 1] - positions[i - 1]) * (
+            (positions[i] - positions[i - 1] + step) * (heights[i + 1] - heights[i]) / (positions[i + 1] - positions[i])
+            + (positions[i + 1] - positions[i] - step) * (heights[i] - heights[i - 1]) / (positions[i] - positions[i - 1])
+            )
+
+
+def parallel_averages(f: str, fields: list, year: str, workers: int = None, chunk_size: int = CHUNK_SIZE) -> dict:
+    """ 
+    Same result as stream_averages, but the file is split into parts of about chunk_size bytes 
+    that are parsed in parallel, one process per part (up to workers processes). Each part is 
+    cut at the end of a row (quoted values can contain commas and newlines) and summed per field
+    and month, the exact sums of the parts are then added together so the averages are identical.
+
+    :param f: File to read from
+    :type f: str
+    :param fields: Fields to read, "Date" is required
+    :type fields: list
+    :param year: Year to average data for
+    :type year: str
+    :param workers: Max number of processes, defaults to the number of CPUs
+    :type workers: int
+    :param chunk_size: Size of the parts in bytes
+    :type chunk_size: int
+    :raise ValueError: Same errors, with the same messages, as stream_averages
+    :return: A dictionary containing each field (except "Date"), with the values being a dictionary 
+        of the months and their average.
+    :rtype: dict
+    """
+
+    if fields == []:
+        raise ValueError("Please provide a list of fields (str)")
+    if _is_binary(f):
+        return stream_averages(f, fields, year)
+
+    with open(f, "rb") as file:
+        header = file.readline()
+        size = os.fstat(file.fileno()).st_size
+    positions = _field_positions(f, next(csv.reader([header.decode("utf-8-sig")]), []), fields)
+
+    # Leave the errors about files without rows or a "Date" field to stream_averages
+    if "Date" not in positions:
+        return stream_averages(f, fields, year)
+
+    ranges = _chunk_ranges(f, len(header), size, max(1, (size - len(header)) // max(1, chunk_size)))
+    jobs = [[f, start, end, [*positions.keys()], [*positions.values()], year] for start, end in ranges]
+
+    # A single part is parsed right away, no need to start any processes
+    if len(jobs) == 1:
+        parts = [_chunk_totals(*jobs[0])]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            parts = [*executor.map(_chunk_totals, *zip(*jobs))]
+
+    # Add the parts together
+    totals = {field: {} for field in positions if field != "Date"}
+    for part, _, _, _ in parts:
+        for field, months in part.items():
+            for month, [partials, count] in months.items():
+                total = totals[field].setdefault(month, [{}, 0])
+                for denominator, numerator in partials.items():
+                    total[0][denominator] = total[0].get(denominator, 0) + numerator
+                total[1] += count
+
+    if not any(rows for _, rows, _, _ in parts):
+        raise ValueError("No data was appended")
+    if not any(in_year for _, _, in_year, _ in parts):
+        raise ValueError(f"Data contains no entries for {year}")
+    if not any(cleaned for _, _, _, cleaned in parts):
+        raise ValueError(f'Data input contains no values for some or all of the following: {*positions,}')
+
+    return {
+        field: {MONTHS[month - 1]: round(_exact_mean(*months[month]), 1) for month in sorted(months)} 
+        for field, months in totals.items()
+        }
+
+
+def _chunk_ranges(f: str, start: int, size: int, chunks: int) -> list:
+    """ 
+    Split a file, from start to size, into about the given number of parts that each end with a 
+    complete row. A newline only ends a row if it's not inside a quoted value, which is the case
+    when the number of quotes before it is even.
+
+    :param f: File to split
+    :type f: str
+    :param start: Where the first row starts (after the header)
+    :type start: int
+    :param size: Size of the file
+    :type size: int
+    :param chunks: Number of parts wanted
+    :type chunks: int
+    :return: List of [start, end] byte offsets
+    :rtype: list
+    """
+
+    boundaries = [start]
+    quotes = 0
+
+    with open(f, "rb") as file:
+        file.seek(start)
+        position = start
+
+        for target in [start + (size - start) * i // chunks for i in range(1, chunks)]:
+            if target <= position:
+                continue
+
+            # Count the quotes up to the target, a block at a time
+            while position < target:
+                block = file.read(min(1024 * 1024, target - position))
+                quotes += block.count(b'"')
+                position += len(block)
+
+            # Then go to the end of the row
+            for line in iter(file.readline, b""):
+                quotes += line.count(b'"')
+                position += len(line)
+                if quotes % 2 == 0:
+                    break
+            boundaries.append(position)
+
+    if boundaries[-1] < size or len(boundaries) == 1:
+        boundaries.append(size)
+    return [[first, last] for first, last in zip(boundaries, boundaries[1:])]
+
+
+def _chunk_totals(f: str, start: int, end: int, names: list, indexes: list, year: str) -> list:
+    """ 
+    Sum one part of a file per field and month, the same way stream_averages does, see 
+    parallel_averages.
+
+    :param f: File to read from
+    :type f: str
+    :param start: Where the part starts
+    :type start: int
+    :param end: Where the part ends
+    :type end: int
+    :param names: Fields to read, in file order
+    :type names: list
+    :param indexes: Column of each field
+    :type indexes: list
+    :param year: Year to sum data for
+    :type year: str
+    :return: A list with the exact sums and counts (field, then month as keys, [sum, count] as
+        value), the number of rows, whether any rows were from the year and whether any were kept
+    :rtype: list
+    """
+
+    with open(f, "rb") as file:
+        file.seek(start)
+        data = file.read(end - start)
+
+    date_index = names.index("Date")
+    value_fields = [(i, field) for i, field in enumerate(names) if field != "Date"]
+    converter = Converter(names)
+
+    totals = {field: {} for _, field in value_fields}
+    rows = 0
+    in_year = False
+    cleaned_any = False
+
+    for row in csv.reader(io.StringIO(data.decode("utf-8"))):
+        if row == []:
+            continue
+        rows += 1
+        length = len(row)
+        values = [row[i] if i < length else None for i in indexes]
+
+        # Only use the rows where the date is from the given year
+        date = values[date_index]
+        if date is None or date[:4] != year:
+            continue
+        in_year = True
+
+        # Skip the row if any of the values are empty
+        cleaned = converter.row(values)
+        if cleaned is None:
+            continue
+        cleaned_any = True
+
+        month = datetime.strptime(cleaned[date_index], r"%Y-%m-%d").month
+        for i, field in value_fields:
+            total = totals[field].setdefault(month, [{}, 0])
+            _add_exact(total[0], cleaned[i])
+            total[1] += 1
+
+    return [totals, rows, in_year, cleaned_any]
+
+
+def partition_years(data: dict) -> dict:
+    """ 
+    Split columns from load_columns into one set of columns per year, in a single pass over the
+    dates. Rows without a valid date are left out.
+
+    :param data: Dictionary of columns, "Date" as datetime64
+    :type data: dict
+    :raise ValueError: If key "Date" missing
+    :return: A dictionary with the year (str) as key and the columns for that year as value, years
+        in chronological order
+    :rtype: dict
+    """
+
+    if "Date" not in data:
+        raise ValueError('Missing required key "Date"')
+
+    dates = data["Date"]
+    valid = np.flatnonzero(~np.isnat(dates))
+    years = dates[valid].astype("datetime64[Y]").astype(np.int64) + 1970
+
+    # Sort the rows by year (stable, so rows keep their order within a year) and find where each year starts
+    by_year = np.argsort(years, kind="stable")
+    order = valid[by_year]
+    unique_years, starts = np.unique(years[by_year], return_index=True)
+    ends = [*starts[1:], len(order)]
+
+    return {
+        str(year): {field: values[order[start:end]] for field, values in data.items()} 
+        for year, start, end in zip(unique_years, starts, ends)
+        }
+
+
+def draw_graphs(graphs: list, workers: int = None) -> list:
+    """ 
+    Draw several graphs in parallel, one process per graph (up to workers processes).
+
+    :param graphs: List of [weight_dict, macros_dict, year, out], the arguments for draw_graph
+    :type graphs: list
+    :param workers: Max number of processes, defaults to the number of CPUs
+    :type workers: int
+    :return: One message per graph, where the file was saved or what went wrong (the graph 
+        couldn't be saved, or the files were switched)
+    :rtype: list
+    """
+
+    messages = []
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(draw_graph, *graph) for graph in graphs]
+
+        for graph, future in zip(graphs, futures):
+            try:
+                messages.append(future.result())
+            except OSError as err:
+                messages.append(f"{graph[2]}: {err}")
+            except KeyError:
+                messages.append(f"{graph[2]}: Something went wrong. You might have switched up your file inputs.")
+
+    return messages
+
+
+def incremental_averages(f: str, fields: list, year: str, state_dir: str = CACHE_DIR) -> dict:
+    """ 
+    Same result as stream_averages for files that only ever get new rows added at the end. The
+    sum and count for each year, month and field is saved along with how far into the file has 
+    been read, so the next run only has to parse the rows added since. If the file was changed
+    in any other way than rows being added, everything is calculated again from the start. The
+    saved sums count towards the size of the cache (see load_columns_cached) and are removed by
+    clear_cache.
+
+    :param f: File to read from
+    :type f: str
+    :param fields: Fields to read, "Date" is required
+    :type fields: list
+    :param year: Year to average data for
+    :type year: str
+    :param state_dir: Directory where the sums are saved
+    :type state_dir: str
+    :raise ValueError: Same errors, with the same messages, as collect_data and clean_data
+    :return: A dictionary containing each field (except "Date"), with the values being a dictionary 
+        of the months and their average.
+    :rtype: dict
+    """
+
+    if fields == []:
+        raise ValueError("Please provide a list of fields (str)")
+    if _is_binary(f):
+        return stream_averages(f, fields, year)
+
+    key = hashlib.sha256("\0".join([os.path.abspath(f), *fields]).encode()).hexdigest()
+    path = os.path.join(state_dir, f"{key}.json")
 
-    # Get inputs
-    weight_file, macros_file, year = get_files_year()
+    with open(f, "rb") as file:
+        state, digest = _load_state(path, file, fields)
 
-    # Collect data from csv
-    try:
-        weight_data = collect_data(weight_file, WEIGHT_FIELDS)
-        macros_data = collect_data(macros_file, MACROS_FIELDS)
-    except ValueError as err:
-        sys.exit(err)
+        # Only read what was added since last time
+        file.seek(state["offset"])
+        tail = file.read()
+
+    # Rows that aren't finished (no newline yet) are used but not saved, they are read again next time
+    end = tail.rfind(b"\n") + 1
+    _add_rows(state, tail[:end])
+    state["offset"] += end
+    digest.update(tail[:end])
+    state["check"] = digest.hexdigest()
 
-    # Cleanup the data in the files
     try:
-        weight_clean = clean_data(weight_data, year)
-        macros_clean = clean_data(macros_data, year)
-    except ValueError as err:
-        sys.exit(err)
+        os.makedirs(state_dir, exist_ok=True)
+        temp = f"{path}.{os.getpid()}.tmp"
+        with open(temp, "w") as file:
+            json.dump(_dump_state(state), file)
+        os.replace(temp, path)
+        _touch(path)
+        _evict_cache(state_dir, CACHE_SIZE)
+    except OSError:
+        pass
 
-    # Average the data
-    weight_average = average_data(weight_clean)
-    macros_average = average_data(macros_clean)
+    if tail[end:].strip() != b"":
+        _add_rows(state, tail[end:])
 
-    # Save the graph and print save location
-    try:
-        print(draw_graph(weight_average, macros_average, year)) 
-    except KeyError:
-        sys.exit("Something went wrong. You might have switched up your file inputs.")
+    return _state_averages(state, year)
 
 
-def collect_data(f: str, fields: list) -> list:
+def watch(weight_file: str, macros_file: str, year: str, out: str = None, fmt: str = None, interval: float = 1.0,
+          debounce: float = 0.5, state_dir: str = CACHE_DIR, stop: threading.Event = None, on_update=None) -> None:
     """ 
-    Collect data from CSV file.
+    Save the graph (or the averages, if a format is given) for a year, and save it again every 
+    time the weight or macros file changes, until stop is set. While nothing changes only the size
+    and modification time of the files are checked, every interval seconds. After a change, it 
+    waits until the files have stayed the same for debounce seconds, so a burst of writes only 
+    gives one update. The averages are calculated with incremental_averages, so only rows added
+    since last time are read, and the graph is only saved again if the averages of some month 
+    have changed.
 
-    :param f: File to read from
-    :type f: str
-    :param fields: Fields to read and return
+    :param weight_file: CSV file with weight
+    :type weight_file: str
+    :param macros_file: CSV file with macros
+    :type macros_file: str
+    :param year: Year to graph
+    :type year: str
+    :param out: Where to save the graph, see draw_graph (or the averages, see write_averages)
+    :type out: str
+    :param fmt: Write the averages as "json" or "csv" instead of drawing the graph
+    :type fmt: str
+    :param interval: Seconds between checks
+    :type interval: float
+    :param debounce: Seconds the files have to stay the same before updating
+    :type debounce: float
+    :param state_dir: Directory where the sums are saved, see incremental_averages
+    :type state_dir: str
+    :param stop: Stop watching when set, runs until interrupted if not given
+    :type stop: threading.Event
+    :param on_update: Called with a message for every update (the months that changed and where 
+        the file was saved) or error, defaults to print
+    :type on_update: function
+    """
+
+    stop = stop or threading.Event()
+    report = on_update or print
+    files = [weight_file, macros_file]
+    seen = None
+    averages = None
+
+    while not stop.is_set():
+        current = _file_stats(files)
+        if current != seen:
+            # Wait for the writes to settle
+            while not stop.wait(debounce):
+                settled = _file_stats(files)
+                if settled == current:
+                    break
+                current = settled
+            if stop.is_set():
+                return
+            seen = current
+
+            try:
+                latest = [
+                    incremental_averages(weight_file, WEIGHT_FIELDS, year, state_dir),
+                    incremental_averages(macros_file, MACROS_FIELDS, year, state_dir),
+                    ]
+                months = _changed_months(averages, latest)
+                if months:
+                    message = write_averages(*latest, year, fmt, out) if fmt else draw_graph(*latest, year, out)
+                    averages = latest
+                    report(f"Updated {', '.join(months)}. {message}")
+            except (OSError, ValueError) as err:
+                report(f"Error: {err}")
+            except KeyError:
+                report("Something went wrong. You might have switched up your file inputs.")
+
+        stop.wait(interval)
+
+
+def _file_stats(files: list) -> list:
+    """ 
+    Size and modification time of each file, used by watch to tell if they have changed.
+
+    :param files: Files to check
+    :type files: list
+    :return: A list of [size, modification time] per file, None for a file that can't be found
+    :rtype: list
+    """
+
+    stats = []
+    for f in files:
+        try:
+            stat = os.stat(f)
+            stats.append([stat.st_size, stat.st_mtime_ns])
+        except OSError:
+            stats.append(None)
+    return stats
+
+
+def _changed_months(old: list, new: list) -> list:
+    """ 
+    Months where any average differs between two lists of averages (weight and macros).
+
+    :param old: Averages from before, None if there are none
+    :type old: list
+    :param new: Averages now
+    :type new: list
+    :return: The months that changed, in calendar order
+    :rtype: list
+    """
+
+    changed = set()
+    for i, averages in enumerate(new):
+        before = old[i] if old else {}
+        for field in averages.keys() | before.keys():
+            months = averages.get(field, {})
+            months_before = before.get(field, {})
+            changed.update(month for month in months.keys() | months_before.keys() 
+                           if months.get(month) != months_before.get(month))
+
+    return [month for month in MONTHS if month in changed]
+
+
+def _load_state(path: str, file, fields: list) -> list:
+    """ 
+    Load the saved sums for a file, or start over if there are none or the file has changed in
+    any other way than new rows at the end. Everything read last time is hashed again and 
+    compared to the hash saved with the sums, so an edit anywhere in it is noticed.
+
+    :param path: Path of the saved state
+    :type path: str
+    :param file: The CSV file, opened in binary mode
+    :type file: file object
+    :param fields: Fields to read
     :type fields: list
-    :raise ValueError: If fields is empty. If specified fields are missing/incorrect in the file
-        If no data was appended
-    :return: A list of dictionaries containing specified fields and their values, one dict per row
+    :raise ValueError: If specified fields are missing/incorrect in the file
+    :return: A list with the state and the hash of the file up to where it was read, to continue
+        hashing the rows read next
     :rtype: list
     """
 
-    data = []
-    file_name = os.path.split(f)
-    missing_fields = []
+    try:
+        with open(path) as saved:
+            state = _parse_state(json.load(saved))
+        size = os.fstat(file.fileno()).st_size
+        if state["fields"] == fields and state["offset"] <= size:
+            digest = _state_digest(file, state["offset"])
+            if state["check"] == digest.hexdigest():
+                return [state, digest]
+    except (OSError, KeyError, TypeError, ValueError):
+        pass
 
-    if fields == []:
-        raise ValueError("Please provide a list of fields (str)")
+    # Start over, the header is the first line
+    file.seek(0)
+    header = file.readline()
+    csv_fields = next(csv.reader([header.decode("utf-8-sig" if header.startswith(b"\xef\xbb\xbf") else "utf-8")]), [])
+    positions = _field_positions(file.name, csv_fields, fields)
 
-    with open(f, "r") as file:
-        reader = csv.DictReader(file)
+    state = {
+        "fields": fields, "names": [*positions.keys()], "indexes": [*positions.values()], "offset": len(header), 
+        "check": "", "last_date": None, "rows": 0, "years": {},
+        }
+    return [state, hashlib.blake2b(header)]
 
-        # Get fieldnames
-        csv_fields = reader.fieldnames
-
-        # Check that the included fields are present, otherwise exit
-        for field in fields:
-            if field not in csv_fields:
-                missing_fields.append(field)
-        if missing_fields != []:
-           raise ValueError(f'{*missing_fields,} field(s) missing/incorrect in: "{file_name[1]}"')
-        
-        # Go through the csv, if a field is not supposed to be included, remove it
-        for row in reader:
-            for field in csv_fields:
-                if field not in fields:
-                    row.pop(field)
 
-            data.append(row)
-    if data == []:
-        raise ValueError("No data was appended")
-    
-    return data
+def _add_rows(state: dict, data: bytes) -> None:
+    """ 
+    Add rows from the CSV file to the sums in the state. Rows are cleaned the same way clean_data
+    does it, rows with a date that can't be read are skipped.
+
+    :param state: The state to update
+    :type state: dict
+    :param data: Complete rows from the CSV file
+    :type data: bytes
+    """
+
+    names = state["names"]
+    indexes = state["indexes"]
+    date_index = names.index("Date") if "Date" in names else None
+    converter = Converter(names)
+
+    for row in csv.reader(io.StringIO(data.decode("utf-8"))):
+        if row == []:
+            continue
+        length = len(row)
+        values = [row[i] if i < length else None for i in indexes]
+        state["rows"] += 1
+        if date_index is None or values[date_index] is None:
+            continue
+
+        date = values[date_index]
+        state["last_date"] = date
+        year = state["years"].setdefault(date[:4], {"rows": 0, "cleaned": 0, "months": {}})
+        year["rows"] += 1
 
+        # Skip the row if any of the values are empty
+        cleaned = converter.row(values)
+        if cleaned is None:
+            continue
+        try:
+            month = datetime.strptime(cleaned[date_index], r"%Y-%m-%d").month
+        except (ValueError, TypeError):
+            continue
+        year["cleaned"] += 1
 
-def clean_data(data: list, year: str) -> list:
+        totals = year["months"].setdefault(month, {})
+        for value, field in zip(cleaned, names):
+            if field != "Date":
+                total = totals.setdefault(field, [Fraction(0), 0])
+                total[0] += Fraction(value)
+                total[1] += 1
+
+
+def _state_averages(state: dict, year: str) -> dict:
     """ 
-    Clean data from list of dictionaries using year to limit what data to clean and return.
-    The key "Date" containing the date (YYYY-MM-DD) is required. Converts str values to float 
-    and omits entries that have atleast one empty value.
+    Averages for a year from the sums in the state, with the same errors as clean_data.
 
-    :param data: List of dictionaries to clean
-    :type data: list
-    :param year: Year to limit what to clean and return
+    :param state: The state
+    :type state: dict
+    :param year: Year to average data for
     :type year: str
-    :raise ValueError: If key "Date" missing. If there are no entries for given year. 
-        Data input contains no values for some or all fields.
-    :return: A list of dictionaries with dates corresponding to the given year, containing the 
-        fields (keys) provided in the list of dictionaries with their values converted to float.
-    :rtype: list
+    :raise ValueError: If there's no data, no "Date", no entries for the year or no values
+    :return: A dictionary containing each field (except "Date"), with the values being a dictionary 
+        of the months and their average.
+    :rtype: dict
     """
 
-    data_year = []
-    fields = data[0].keys()
-    cleaned_data = []
+    names = state["names"]
 
-    if "Date" not in fields:
+    if state["rows"] == 0:
+        raise ValueError("No data was appended")
+    if "Date" not in names:
         raise ValueError('Missing required key "Date"')
 
-    for row in data:
-        # Only append if the given year is in the datasets "Date" field
-        if year in row["Date"][:4]:
-            data_year.append(row)
-    
-    if data_year == []:
+    entry = state["years"].get(year, {"rows": 0})
+    if entry["rows"] == 0:
         raise ValueError(f"Data contains no entries for {year}")
-    
-    # For each row in original data, for each field in that row, convert the value to float
-    for row in data_year:
-        for field in fields:
-            blank = []
+    if entry["cleaned"] == 0:
+        raise ValueError(f'Data input contains no values for some or all of the following: {*names,}')
 
-            # Convert str to float, skip the value if it's empty
-            if row[field] == "" or "," in row[field]:
-                try:
-                    row[field] = float(row[field].replace(",", ".").strip())
-                except ValueError:
-                    blank.append("")
-                    break
-            # Convert str to float, skip if the value is not numbers only
-            elif row[field].isdigit():
-                 row[field] = float(row[field])
-            # Do nothing if the field is "Date"
-            elif field == "Date":
-                pass
-            else:
-                blank.append("")
-                break
-        
-        # If there are no empty values append row to cleaned_data
-        if "" not in blank:
-            cleaned_data.append(row)
+    months = sorted(entry["months"])
+    return {
+        field: {MONTHS[month - 1]: round(float(entry["months"][month][field][0] / entry["months"][month][field][1]), 1) for month in months}
+        for field in names if field != "Date"
+        }
 
-    # If not data was appended show message and exit, otherwise return the data
-    if cleaned_data == []:
-        raise ValueError(f'Data input contains no values for some or all of the following: {*fields,}')
-    else:
-        return cleaned_data
-    
 
-def average_data(data: list) -> dict:
+def _state_digest(file, offset: int):
     """ 
-    Averages the data from a list of dictionaries, returning a dictionary. The new dictionary will
-    omit the key "Date" (used only to collect and store averages for a given month). Each of the other
-    keys' values will be another dictionary, containing the month as key and average as value. The key 
-    "Date" containing the date (YYYY-MM-DD) is required. 
+    Hash a file from the start up to offset, used to tell if the part of the file that was 
+    already read has changed. Read in 1 MB blocks, hashing is much faster than parsing the rows.
 
-    :param data: A list of dictionaries
-    :type data: list
-    :return: A dictionary containing each key (except "Date"), with the values being a dictionary of
-        the months and their average.
+    :param file: The file, opened in binary mode
+    :type file: file object
+    :param offset: How far into the file was read
+    :type offset: int
+    :return: The hash, more can be added to it with update
+    :rtype: hashlib.blake2b
+    """
+
+    digest = hashlib.blake2b()
+    file.seek(0)
+    left = offset
+    while left > 0:
+        block = file.read(min(left, 1024 * 1024))
+        if not block:
+            break
+        digest.update(block)
+        left -= len(block)
+    return digest
+
+
+def _dump_state(state: dict) -> dict:
+    """ 
+    Convert a state to something that can be saved as JSON, the sums are saved as fractions (str)
+    so they stay exact.
+
+    :param state: The state
+    :type state: dict
+    :return: The state with the sums as str
     :rtype: dict
     """
-    # Remove "Date" from fields so it won't try to append and average the dates
-    fields = [*data[0].keys()]
-    fields.remove("Date")
 
-    averages = {}
+    years = {
+        year: {**entry, "months": {
+            month: {field: [str(total[0]), total[1]] for field, total in totals.items()} 
+            for month, totals in entry["months"].items()
+            }}
+        for year, entry in state["years"].items()
+        }
+    return {**state, "years": years}
 
-    for field in fields:
-        # Reset the dict so it won't keep appending to the values of the previous field
-        month_data = {}
-
-        for row in data:
-
-            # Extract date YYYY-MM-DD format
-            date_day = datetime.strptime(row["Date"], r"%Y-%m-%d")
-            
-            # Format month num to month str, ex. 10 to October
-            month_str = "{0:%B}".format(date_day)     
-            
-            # If month (str), not in dict store the data for that month in a list as the value for the month
-            if month_str not in month_data:
-                month_data[month_str] = [row[field]]
-            else:
-                month_data[month_str].append(row[field])
 
-        # Store the averages per month as the value for the specific field
-        if field not in averages:
-            averages[field] = {month: round(mean(month_data[month]), 1) for month in month_data}
+def _parse_state(state: dict) -> dict:
+    """ 
+    Convert a state loaded from JSON back, the opposite of _dump_state.
+
+    :param state: The state as loaded from JSON
+    :type state: dict
+    :return: The state with the sums as Fraction
+    :rtype: dict
+    """
 
-    return averages
+    for entry in state["years"].values():
+        entry["months"] = {
+            int(month): {field: [Fraction(total[0]), total[1]] for field, total in totals.items()}
+            for month, totals in entry["months"].items()
+            }
+    return state
 
 
-def get_files_year() -> list:
+def get_files_year(ask_year: bool = True) -> list:
     """ 
     Ask questions needed in order to get two CSV files and a valid year in YYYY format. Keep
     asking until valid responses are given.
 
+    :param ask_year: Ask for a year, if False only the files are asked for
+    :type ask_year: bool
     :raise FileNotFoundError: If the file doesn't exist
     :return: A list of file names and a year
     :rtype: list
     """
     # Questions to ask the user
     questions = ["Weight file: ", "Macros file: ", "Year: "]
+    if not ask_year:
+        questions.pop()
     responses = []
  
     # Get input from the user and store in a list
@@ -214,36 +3006,121 @@ def get_files_year() -> list:
     while True:
 
         # Get the file inputs from the user, with extension and error checking
-        if i < len(questions)-1:
+        if "Year" not in questions[i]:
             response = input(questions[i])  
-            extension = os.path.splitext(response)
-            if extension[1] != ".csv":
-                print(f"{response} is not a CSV")
-                continue
             try:
-                with open(response):        
-                    i += 1
-                    responses.append(response)
-                    continue
-            except FileNotFoundError:
-                print(f"{response} does not exist")
+                responses.append(check_csv(response))
+                i += 1
+            except ValueError as err:
+                print(err)
                 continue
 
+            # Done if no year is needed
+            if i == len(questions):
+                return responses
+
         # Validate that the year is in YYYY format and return a list with the responses
         elif "Year" in questions[i]:
             response = input(questions[i])
-            if _ := re.search(r"^(\d{4}){1}$", response):
-                responses.append(response)
+            try:
+                responses.append(check_year(response))
                 return responses
-            else:
-                print(f"Please provide a year in YYYY format")
+            except ValueError as err:
+                print(err)
                 continue
 
 
-def draw_graph(weight_dict: dict, macros_dict: dict, year: str) -> str:
+def check_csv(f: str) -> str:
+    """ 
+    Check that a file is a CSV (by extension) and that it exists. Binary columnar files (see 
+    write_binary) are accepted as well.
+
+    :param f: The file
+    :type f: str
+    :raise ValueError: If the file isn't a CSV or doesn't exist
+    :return: The file
+    :rtype: str
+    """
+
+    extension = os.path.splitext(f)
+    if extension[1] not in [".csv", BINARY_EXTENSION]:
+        raise ValueError(f"{f} is not a CSV")
+    try:
+        with open(f):        
+            return f
+    except FileNotFoundError:
+        raise ValueError(f"{f} does not exist")
+
+
+def check_year(year: str) -> str:
+    """ 
+    Check that a year is in YYYY format.
+
+    :param year: The year
+    :type year: str
+    :raise ValueError: If the year isn't in YYYY format
+    :return: The year
+    :rtype: str
+    """
+
+    if not re.search(r"^(\d{4}){1}$", year):
+        raise ValueError("Please provide a year in YYYY format")
+    return year
+
+
+def write_averages(weight_dict: dict, macros_dict: dict, year: str, fmt: str, out: str = None) -> str:
+    """ 
+    Write the averages from average_data (or window_averages) as JSON or CSV instead of drawing a
+    graph. JSON is an object with the year and the averages per field and month, CSV has one row 
+    per month (or window, in chronological order) and one column per field.
+
+    :param weight_dict: A dictionary containing average weight for month(s)
+    :type weight_dict: dict
+    :param macros_dict: A dictionary containing average macros for month(s)
+    :type macros_dict: dict
+    :param year: Year the average is for
+    :type year: str
+    :param fmt: "json" or "csv"
+    :type fmt: str
+    :param out: File to write to, if not given the text is returned instead
+    :type out: str
+    :raise ValueError: If the format isn't json or csv
+    :return: String displaying where file was saved, or the JSON/CSV text
+    :rtype: str
+    """
+
+    averages = {**weight_dict, **macros_dict}
+
+    if fmt == "json":
+        text = json.dumps({"year": year, "averages": averages}, indent=2)
+    elif fmt == "csv":
+        # Every month found in any of the fields, in the same order as the month names. Other windows 
+        # (see window_averages) are labeled by date, so they're in chronological order when sorted
+        labels = {label for values in averages.values() for label in values}
+        by_month = labels <= set(MONTHS)
+        months = [month for month in MONTHS if month in labels] if by_month else sorted(labels)
+        text = io.StringIO()
+        writer = csv.writer(text, lineterminator="\n")
+        writer.writerow(["Month" if by_month else "Window", *averages.keys()])
+        for month in months:
+            writer.writerow([month, *[values.get(month, "") for values in averages.values()]])
+        text = text.getvalue().rstrip("\n")
+    else:
+        raise ValueError(f"Unknown format: {fmt}")
+
+    if out is None:
+        return text
+
+    with open(out, "w", newline="") as file:
+        file.write(text + "\n")
+    return f"File saved: {out}"
+
+
+def draw_graph(weight_dict: dict, macros_dict: dict, year: str, out: str = None) -> str:
     """ 
     Plots a line graph for average weight, and a bar graph for average macros (calories, protein,
-    fat, carbs). Saves the figure (.png) in the current working directory. 
+    fat, carbs). Saves the figure (.png) in the current working directory. Averages for finer 
+    windows than months (see window_averages) are plotted the same way, with fewer labels.
 
     :param weight_dict: A dictionary containing average weight for month(s)
     :type weight_dict: dict
@@ -251,6 +3128,9 @@ def draw_graph(weight_dict: dict, macros_dict: dict, year: str) -> str:
     :type macros_dict: dict
     :param year: Year the average is for
     :type year: str
+    :param out: Where to save the figure, defaults to averages_<year>.png in the current working directory.
+        A binary file object is written to as PNG
+    :type out: str
     :return: String displaying where file was saved
     :rtype: str
     """
@@ -269,84 +3149,447 @@ def draw_graph(weight_dict: dict, macros_dict: dict, year: str) -> str:
     # Make a separate list for calories height to avoid the bar scales being too different
     calories_height = [key * 0.25 for key in macros_dict["Calories"].values()]
 
-    # Set style
-    #plt.style.use('dark_background')
-    plt.style.use('https://github.com/dhaitz/matplotlib-stylesheets/raw/master/pitayasmoothie-dark.mplstyle')
+    # Imported here since it's slow to import and only needed for the graph
+    import matplotlib
 
-    # Create plot object
-    fig, (ax1, ax2) = plt.subplots(2, figsize=(16, 9))
+    # Set style, and reuse the plot object (cleared) from the last graph
+    with matplotlib.rc_context(_graph_style()):
+        fig, (ax1, ax2) = _graph_figure()
 
-    # Set graph title
-    plt.suptitle(f"Averages {year}", size=25, weight="bold", y=0.96)
+        # Set graph title
+        fig.suptitle(f"Averages {year}", size=25, weight="bold", y=0.96)
 
-    # Create line plot
-    ax1.plot(
-        weight_keys, weight_values, linewidth=3, markersize=10, marker="o", color="deepskyblue", 
-        markerfacecolor="dodgerblue", label="Avg. Weight"
-        )
+        # Create line plot, markers are only shown while there's room for them
+        ax1.plot(
+            weight_keys, weight_values, linewidth=3, markersize=10, marker="o" if len(weight_keys) <= GRAPH_POINTS else None, 
+            color="deepskyblue", markerfacecolor="dodgerblue", label="Avg. Weight"
+            )
+
+        # Band from the 10th to the 90th percentile and the median, if they were calculated (see average_data)
+        if (band := _quantile_band(weight_dict, "Weight", weight_keys)) is not None:
+            ax1.fill_between(weight_keys, band[0], band[2], color="deepskyblue", alpha=0.2, linewidth=0, label="p10-p90")
+            ax1.plot(weight_keys, band[1], linewidth=2, linestyle="dashed", color="dodgerblue", label="Median")
+
+        # Plot styling for ax 1
+        ax1.spines[["right", "top", "left", "bottom"]].set_visible(False)
+        ax1.grid(linestyle = "dashed", color="white", alpha=0.2)
+        ax1.tick_params(color="lightgray")
+        ax1.set_ylabel('Weight', size=18, weight="bold", style="italic", labelpad=20)
+
+        # Set labels for weight, every step:th point when there are too many to fit
+        step = max(-(-len(weight_keys) // GRAPH_LABELS), 1)
+        weight_labels = [tick for tick in range(0, len(weight_keys), step)]
+        ax1.set_xticks(weight_labels)
+        ax1.set_xticklabels(weight_keys[::step], weight="bold")
 
-    # Plot styling for ax 1
-    ax1.spines[["right", "top", "left", "bottom"]].set_visible(False)
-    ax1.grid(linestyle = "dashed", color="white", alpha=0.2)
-    ax1.tick_params(color="lightgray")
-    ax1.set_ylabel('Weight', size=18, weight="bold", style="italic", labelpad=20)
-
-    # Set labels for weight
-    weight_labels = [tick for tick in range(len(weight_keys))]
-    ax1.set_xticks(weight_labels)
-    ax1.set_xticklabels(weight_keys, weight="bold")
-
-    width = 0.21
-
-    # Offsets for bar positions
-    x_calories = [x - (width * 1.5) for x in range(len(calories_values))]
-    x_protein = [x - (width / 2) for x in range(len(protein_values))]
-    x_fat = [x + (width / 2) for x in range(len(fat_values))]
-    x_carbs = [x + (width * 1.5) for x in range(len(carbs_values))]
-
-    # Set lables on x-axis for macros
-    macro_labels = [tick for tick in range(len(calories_keys))]
-    ax2.set_xticks(macro_labels)
-    ax2.set_xticklabels(calories_keys, weight="bold")
-
-    # Create bars for macros
-    ax2.bar(x_calories, calories_height, width, label="Calories", fc="springgreen")
-    ax2.bar(x_protein, protein_values, width, label="Protein", fc="dodgerblue")
-    ax2.bar(x_fat, fat_values, width, label="Fat", fc="deepskyblue")
-    ax2.bar(x_carbs, carbs_values, width, label="Carbs", fc="aquamarine")
-
-    # Add a label to each bar, use calories values for calorie bars because they are scaled down with 
-    # alternative values (calories_height)
-    for c in ax2.containers:
-
-        # c is bar containter object
-        label = c.get_label()
-        if label == "Calories":
-            ax2.bar_label(c, labels=calories_values, weight="bold", color="white")
+        width = 0.21
 
+        # Offsets for bar positions
+        x_calories = [x - (width * 1.5) for x in range(len(calories_values))]
+        x_protein = [x - (width / 2) for x in range(len(protein_values))]
+        x_fat = [x + (width / 2) for x in range(len(fat_values))]
+        x_carbs = [x + (width * 1.5) for x in range(len(carbs_values))]
+
+        # Set lables on x-axis for macros
+        step = max(-(-len(calories_keys) // GRAPH_LABELS), 1)
+        macro_labels = [tick for tick in range(0, len(calories_keys), step)]
+        ax2.set_xticks(macro_labels)
+        ax2.set_xticklabels(calories_keys[::step], weight="bold")
+
+        # Create bars for macros, or lines if there are too many to tell apart
+        if len(calories_keys) > GRAPH_POINTS:
+            for values, label, color in [[calories_height, "Calories", "springgreen"], [protein_values, "Protein", "dodgerblue"],
+                                         [fat_values, "Fat", "deepskyblue"], [carbs_values, "Carbs", "aquamarine"]]:
+                ax2.plot(range(len(values)), values, linewidth=2, label=label, color=color)
         else:
-            ax2.bar_label(c, weight="bold", color="white")
+            ax2.bar(x_calories, calories_height, width, label="Calories", fc="springgreen")
+            ax2.bar(x_protein, protein_values, width, label="Protein", fc="dodgerblue")
+            ax2.bar(x_fat, fat_values, width, label="Fat", fc="deepskyblue")
+            ax2.bar(x_carbs, carbs_values, width, label="Carbs", fc="aquamarine")
+
+        # Add a label to each bar, use calories values for calorie bars because they are scaled down with 
+        # alternative values (calories_height). Left out when there are too many bars to read them
+        for c in ax2.containers if len(calories_keys) <= GRAPH_LABELS else []:
+
+            # c is bar containter object
+            label = c.get_label()
+            if label == "Calories":
+                ax2.bar_label(c, labels=calories_values, weight="bold", color="white")
+
+            else:
+                ax2.bar_label(c, weight="bold", color="white")
+
+        # Calories from the 10th to the 90th percentile and the median on each bar, scaled like the bars
+        if (band := _quantile_band(macros_dict, "Calories", calories_keys)) is not None:
+            low, median, high = [[value * 0.25 for value in values] for values in band]
+            ax2.errorbar(
+                x_calories, median, yerr=[[m - l for l, m in zip(low, median)], [h - m for m, h in zip(median, high)]], 
+                fmt="_", markersize=12, capsize=4, color="white", label="Cal. p10-p90"
+                )
     
-    # Plot styling for ax2
-    ax2.spines[["right", "top", "left", "bottom"]].set_visible(False)
-    ax2.grid(linestyle ="dashed", color="white", alpha=0.2)
-    ax2.tick_params(left=0, labelleft=0, color="lightgray")
-    ax2.set_ylabel('Macros', size=18, weight="bold", style="italic", labelpad=20)
-
-    # Align the labels describing the category i.e "Weight" and "Macros"
-    fig.align_ylabels([ax1, ax2])
-
-    # Show legends
-    ax1.legend(frameon=1, shadow=1, framealpha=1.0, borderpad=0.8, bbox_to_anchor=(1.0, 1.05), loc="upper left")
-    ax2.legend(frameon=1, shadow=1, framealpha=1.0, borderpad=0.8, bbox_to_anchor=(1.0, 1.05), loc="upper left")
-
-    # Show plot
-    #plt.show()
-    # Save plot
-    cwd = os.getcwd()
-    plt.savefig(f"{cwd}\\averages_{year}")
-
-    return f"File saved: {cwd}\\averages_{year}.png"
+        # Plot styling for ax2
+        ax2.spines[["right", "top", "left", "bottom"]].set_visible(False)
+        ax2.grid(linestyle ="dashed", color="white", alpha=0.2)
+        ax2.tick_params(left=0, labelleft=0, color="lightgray")
+        ax2.set_ylabel('Macros', size=18, weight="bold", style="italic", labelpad=20)
+
+        # Align the labels describing the category i.e "Weight" and "Macros"
+        fig.align_ylabels([ax1, ax2])
+
+        # Show legends
+        ax1.legend(frameon=1, shadow=1, framealpha=1.0, borderpad=0.8, bbox_to_anchor=(1.0, 1.05), loc="upper left")
+        ax2.legend(frameon=1, shadow=1, framealpha=1.0, borderpad=0.8, bbox_to_anchor=(1.0, 1.05), loc="upper left")
+
+        # Show plot
+        #plt.show()
+        # Save plot, to a path or a file object (see render_graph)
+        if out is not None and not isinstance(out, str):
+            fig.savefig(out, format="png")
+            return f"File saved: {getattr(out, 'name', 'memory')}"
+        if out:
+            fig.savefig(out)
+            return f"File saved: {out}"
+
+        cwd = os.getcwd()
+        fig.savefig(f"{cwd}\\averages_{year}")
+
+        return f"File saved: {cwd}\\averages_{year}.png"
+
+
+def _quantile_band(averages: dict, field: str, keys: list) -> list:
+    """ 
+    The 10th percentile, median and 90th percentile of a field from average_data, for draw_graph.
+
+    :param averages: Averages from average_data, with quantiles
+    :type averages: dict
+    :param field: Field to get the quantiles for
+    :type field: str
+    :param keys: Months (or other windows) to get them for, in the order they're drawn
+    :type keys: list
+    :return: A list with one list of values per quantile, None if they weren't calculated
+    :rtype: list
+    """
+
+    names = [f"{field} (p10)", f"{field} (median)", f"{field} (p90)"]
+    if not all(name in averages for name in names):
+        return None
+    return [[averages[name][key] for key in keys] for name in names]
+
+
+def _graph_style() -> dict:
+    """ 
+    Load the style used by draw_graph from the bundled style file, only read once.
+
+    :return: The style as rc parameters
+    :rtype: dict
+    """
+
+    import matplotlib
+
+    global _STYLE
+    if _STYLE is None:
+        _STYLE = matplotlib.rc_params_from_file(STYLE_FILE, use_default_template=False)
+    return _STYLE
+
+
+def _graph_figure() -> list:
+    """ 
+    Get the plot object used by draw_graph. It's created the first time, after that the same 
+    figure is reused with its axes cleared, rather than creating (and leaking) a new one per graph. 
+    The figure is drawn with the Agg canvas directly, without pyplot, so no GUI backend is involved.
+
+    :return: The figure and a list of its two axes
+    :rtype: list
+    """
+
+    import matplotlib
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    global _FIGURE
+    if _FIGURE is None:
+        fig = Figure(figsize=(16, 9))
+        FigureCanvasAgg(fig)
+        _FIGURE = [fig, fig.subplots(2)]
+    else:
+        fig, axes = _FIGURE
+        for ax in axes:
+            ax.clear()
+        fig.set_facecolor(matplotlib.rcParams["figure.facecolor"])
+
+    return _FIGURE
+
+
+def render_graph(weight_dict: dict, macros_dict: dict, year: str) -> bytes:
+    """ 
+    Same graph as draw_graph, returned as PNG bytes instead of being saved.
+
+    :param weight_dict: A dictionary containing average weight for month(s)
+    :type weight_dict: dict
+    :param macros_dict: A dictionary containing average macros for month(s)
+    :type macros_dict: dict
+    :param year: Year the average is for
+    :type year: str
+    :raise KeyError: If the weight and macros dictionaries are switched
+    :return: The graph as PNG
+    :rtype: bytes
+    """
+
+    buffer = io.BytesIO()
+    draw_graph(weight_dict, macros_dict, year, buffer)
+    return buffer.getvalue()
+
+
+class ReportCache:
+    """ 
+    Keeps what the report server needs warm in memory: the parsed columns of at most max_files 
+    files, and the rendered graphs (PNG bytes) in an LRU cache of at most max_size bytes, the least
+    recently used ones are dropped first. Graphs are keyed by 
+    the content hash of both files and the year, and a file is only hashed again (and parsed 
+    again if the hash changed) when its size or modification time changes. Graphs for content 
+    that has changed are dropped. Graphs are rendered in worker processes, and a graph that is 
+    already being rendered is waited for instead of rendered twice. Safe to use from several 
+    threads.
+
+    :param workers: Max number of rendering processes, defaults to the number of CPUs
+    :type workers: int
+    :param max_size: Max size of the rendered graphs kept, in bytes
+    :type max_size: int
+    :param max_files: Max number of parsed files kept (each file and fields)
+    :type max_files: int
+    """
+
+    def __init__(self, workers: int = None, max_size: int = SERVER_CACHE_SIZE, max_files: int = SERVER_FILES):
+        self.max_size = max_size
+        self.max_files = max_files
+        self.hits = 0
+        self.renders = 0
+        self._workers = workers
+        self._executor = None
+        self._files = OrderedDict()
+        self._graphs = OrderedDict()
+        self._size = 0
+        self._pending = {}
+        self._lock = threading.Lock()
+
+    def columns(self, f: str, fields: list) -> list:
+        """ 
+        Columns of a file, see load_columns, parsed again only if the content has changed.
+
+        :param f: File to read from
+        :type f: str
+        :param fields: Fields to read and return
+        :type fields: list
+        :raise ValueError: Same errors as check_csv and load_columns
+        :raise OSError: If the file can't be read
+        :return: A list with the content hash and the columns
+        :rtype: list
+        """
+
+        stat = os.stat(check_csv(f))
+        key = (os.path.abspath(f), *fields)
+
+        with self._lock:
+            entry = self._files.get(key)
+            if entry:
+                self._files.move_to_end(key)
+        if entry and entry[:2] == [stat.st_size, stat.st_mtime_ns]:
+            return entry[2:]
+
+        digest = _file_digest(f)
+        columns = entry[3] if entry and entry[2] == digest else load_columns(f, fields)
+
+        with self._lock:
+            self._files[key] = [stat.st_size, stat.st_mtime_ns, digest, columns]
+            if entry and entry[2] != digest:
+                self._forget(entry[2])
+            while len(self._files) > self.max_files:
+                self._files.popitem(last=False)
+        return [digest, columns]
+
+    def averages(self, weight_file: str, macros_file: str, year: str) -> list:
+        """ 
+        Clean and average the (cached) columns of both files for a year.
+
+        :param weight_file: File with weight
+        :type weight_file: str
+        :param macros_file: File with macros
+        :type macros_file: str
+        :param year: Year to average
+        :type year: str
+        :raise ValueError: If the files or the data in them are not valid
+        :return: A list with the weight averages, macros averages and the key of the graph
+        :rtype: list
+        """
+
+        weight_digest, weight_columns = self.columns(weight_file, WEIGHT_FIELDS)
+        macros_digest, macros_columns = self.columns(macros_file, MACROS_FIELDS)
+        return [
+            average_data(clean_data(weight_columns, year)), average_data(clean_data(macros_columns, year)),
+            (weight_digest, macros_digest, year),
+            ]
+
+    def graph(self, weight_file: str, macros_file: str, year: str) -> bytes:
+        """ 
+        The graph for both files and a year as PNG, from the cache or rendered in a worker 
+        process.
+
+        :param weight_file: File with weight
+        :type weight_file: str
+        :param macros_file: File with macros
+        :type macros_file: str
+        :param year: Year to graph
+        :type year: str
+        :raise ValueError: If the files or the data in them are not valid
+        :raise KeyError: If the weight and macros files are switched
+        :return: The graph as PNG
+        :rtype: bytes
+        """
+
+        weight_average, macros_average, key = self.averages(weight_file, macros_file, year)
+
+        with self._lock:
+            if key in self._graphs:
+                self._graphs.move_to_end(key)
+                self.hits += 1
+                return self._graphs[key]
+
+            # Render it, unless another thread already is
+            future = self._pending.get(key)
+            if future is None:
+                if self._executor is None:
+                    self._executor = ProcessPoolExecutor(max_workers=self._workers)
+                future = self._pending[key] = self._executor.submit(render_graph, weight_average, macros_average, year)
+                self.renders += 1
+
+        try:
+            png = future.result()
+        finally:
+            with self._lock:
+                self._pending.pop(key, None)
+
+        with self._lock:
+            if key not in self._graphs:
+                self._graphs[key] = png
+                self._size += len(png)
+
+            # Remove the least recently used graphs until it fits
+            while self._size > self.max_size and len(self._graphs) > 1:
+                _, removed = self._graphs.popitem(last=False)
+                self._size -= len(removed)
+        return png
+
+    def close(self) -> None:
+        """ 
+        Stop the rendering processes.
+        """
+
+        if self._executor is not None:
+            self._executor.shutdown()
+            self._executor = None
+
+    def _forget(self, digest: str) -> None:
+        """ 
+        Drop the graphs made from content that has changed, the lock has to be held.
+
+        :param digest: Content hash of the old content
+        :type digest: str
+        """
+
+        for key in [key for key in self._graphs if digest in key[:2]]:
+            self._size -= len(self._graphs.pop(key))
+
+
+def make_server(port: int = 8000, weight_file: str = None, macros_file: str = None, cache: ReportCache = None,
+                host: str = "127.0.0.1", root: str = None) -> ThreadingHTTPServer:
+    """ 
+    Create the report server, every request is handled in its own thread. It serves the graph at
+    /averages.png and the averages (see write_averages) at /averages.json, for the files and year
+    given as query parameters: ?weight=<file>&macros=<file>&year=<YYYY>. weight and macros can be 
+    left out if the files are given here. Files given in a request have to be in root (or one of
+    its subdirectories), the files given here are always allowed. Start it with serve_forever.
+
+    :param port: Port to listen on, 0 picks a free one
+    :type port: int
+    :param weight_file: File with weight used when none is given in the request
+    :type weight_file: str
+    :param macros_file: File with macros used when none is given in the request
+    :type macros_file: str
+    :param cache: Cache to use, see ReportCache
+    :type cache: ReportCache
+    :param host: Address to listen on
+    :type host: str
+    :param root: Directory the files in requests are read from, defaults to the current directory
+    :type root: str
+    :return: The server
+    :rtype: ThreadingHTTPServer
+    """
+
+    server = ThreadingHTTPServer((host, port), _ReportHandler)
+    server.daemon_threads = True
+    server.cache = cache or ReportCache()
+    server.files = {"weight": weight_file, "macros": macros_file}
+    server.root = os.path.realpath(root or os.getcwd())
+    return server
+
+
+class _ReportHandler(BaseHTTPRequestHandler):
+    """ 
+    Handles the requests of the report server, see make_server.
+    """
+
+    def do_GET(self):
+        url = urlparse(self.path)
+        query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+
+        if url.path not in ["/averages.png", "/averages.json"]:
+            self._send(404, "text/plain", b"Not found, use /averages.png or /averages.json")
+            return
+
+        try:
+            weight_file = query.get("weight") or self.server.files["weight"]
+            macros_file = query.get("macros") or self.server.files["macros"]
+            if not weight_file or not macros_file:
+                raise ValueError("Please provide weight and macros files")
+            year = check_year(query.get("year", ""))
+
+            # Only read the files given at startup and the ones in root
+            given = [os.path.realpath(f) for f in self.server.files.values() if f]
+            for f in [weight_file, macros_file]:
+                path = os.path.realpath(f)
+                if path not in given and os.path.commonpath([self.server.root, path]) != self.server.root:
+                    self._send(403, "text/plain", f"{f} is not in the served directory".encode())
+                    return
+
+            if url.path == "/averages.png":
+                self._send(200, "image/png", self.server.cache.graph(weight_file, macros_file, year))
+            else:
+                weight_average, macros_average, _ = self.server.cache.averages(weight_file, macros_file, year)
+                self._send(200, "application/json", write_averages(weight_average, macros_average, year, "json").encode())
+        except ValueError as err:
+            self._send(400, "text/plain", str(err).encode())
+        except KeyError:
+            self._send(400, "text/plain", b"Something went wrong. You might have switched up your file inputs.")
+        except OSError as err:
+            self._send(403 if isinstance(err, PermissionError) else 500, "text/plain", f"Can't read {err.filename}: {err.strerror}".encode())
+
+    def _send(self, status: int, content_type: str, body: bytes) -> None:
+        """ 
+        Send a response.
+
+        :param status: HTTP status code
+        :type status: int
+        :param content_type: Type of the body
+        :type content_type: str
+        :param body: The body
+        :type body: bytes
+        """
+
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,34 @@
+from benchmark import generate_logs, compare_results
+from project import WEIGHT_FIELDS, MACROS_FIELDS, collect_data, load_columns
+import numpy as np
+
+
+def test_generate_logs(tmp_path):
+    weight_file, macros_file = generate_logs(str(tmp_path), 2, blank=0.5, extra=2)
+
+    # Daily rows for two whole years, with the unused columns
+    weight = collect_data(weight_file, WEIGHT_FIELDS)
+    assert len(weight) in [730, 731]
+    with open(macros_file) as file:
+        assert file.readline().strip() == "Date,Calories,Protein (g),Fat (g),Carbs (g),Extra 1,Extra 2"
+
+    # Comma decimals and roughly the requested share of blank rows
+    assert any("," in row["Weight"] for row in weight)
+    blanks = np.isnan(load_columns(macros_file, MACROS_FIELDS)["Calories"]).mean()
+    assert 0.4 < blanks < 0.6
+
+    # Same seed, same files
+    (tmp_path / "again").mkdir()
+    again = generate_logs(str(tmp_path / "again"), 2, blank=0.5, extra=2)
+    with open(weight_file) as first, open(again[0]) as second:
+        assert first.read() == second.read()
+
+
+def test_compare_results():
+    old = {"info": {"commit": "abc123"}, "results": [{"years": 1, "stage": "load_columns", "seconds": 0.002}]}
+    new = {"info": {"commit": "def456"}, "results": [{"years": 1, "stage": "load_columns", "seconds": 0.001}, 
+                                                     {"years": 1, "stage": "draw_graph", "seconds": 0.5}]}
+    lines = compare_results(old, new)
+    assert lines[0] == "Compared with abc123:"
+    assert len(lines) == 2
+    assert lines[1].endswith("(0.50x)")
@@ -1,6 +1,20 @@
-from project import collect_data, clean_data, average_data, get_files_year, draw_graph
+from project import (Converter, parallel_averages, collect_data, load_columns, load_columns_cached, clear_cache, load_year, build_index, write_binary, load_binary, export_csv, clean_data, join_data, average_data, window_averages, QuantileEstimator, stream_averages, 
+                     incremental_averages, partition_years, graph_years, 
+                     get_files_year, check_csv, check_year, run_job, run_manifest, write_averages, draw_graph,
+                     render_graph, ReportCache, make_server, watch)
+import json
+import numpy as np
 import os
 import pytest
+import statistics
+import shutil
+import subprocess
+import sys
+import threading
+import time
+import tracemalloc
+import urllib.error
+import urllib.request
 
 def test_collect_data():
     # Test files with data
@@ -39,6 +53,222 @@ def test_collect_data():
     assert str(info.value) == "No data was appended"
 
 
+def test_load_columns():
+    # Only the requested fields are kept, as typed arrays
+    weight = load_columns("test_weight.csv", ["Date", "Weight"])
+    assert [*weight.keys()] == ["Date", "Weight"]
+    assert weight["Date"].dtype == np.dtype("datetime64[D]")
+    assert weight["Date"][0] == np.datetime64("2023-03-27")
+    assert np.array_equal(weight["Weight"], [74.5, 73.6, 74.1, 74.3, np.nan, np.nan], equal_nan=True)
+
+    macros = load_columns("test_intake.csv", ["Date", "Calories", "Protein (g)", "Fat (g)", "Carbs (g)"])
+    assert "Cat" not in macros
+    assert len(macros["Date"]) == 11
+    assert macros["Calories"][0] == 1611.0
+    assert np.isnan(macros["Calories"][2])
+
+    # Blank and invalid values are counted per field
+    errors = {}
+    load_columns("test_weight.csv", ["Date", "Weight"], errors)
+    assert errors == {"Date": {"blank": 0, "invalid": 0}, "Weight": {"blank": 2, "invalid": 0}}
+
+    # Same errors as collect_data
+    with pytest.raises(ValueError) as info:
+        load_columns("test_weight_noDate_field.csv", ["Date", "Weight"])
+    assert str(info.value) == '(\'Date\',) field(s) missing/incorrect in: "test_weight_noDate_field.csv"'
+    with pytest.raises(ValueError) as info:
+        load_columns("test_intake.csv", [])
+    assert str(info.value) == "Please provide a list of fields (str)"
+    with pytest.raises(ValueError) as info:
+        load_columns("test_intake_noData.csv", ["Date", "Calories", "Protein (g)", "Fat (g)", "Carbs (g)"])
+    assert str(info.value) == "No data was appended"
+
+
+def test_load_columns_cached(tmp_path):
+    cache_dir = str(tmp_path / "cache")
+    weight_file = str(tmp_path / "weight.csv")
+    shutil.copy("test_weight.csv", weight_file)
+    fields = ["Date", "Weight"]
+
+    # First read parses and caches, second read comes from the cache
+    first = load_columns_cached(weight_file, fields, cache_dir)
+    assert len(os.listdir(cache_dir)) == 1
+    second = load_columns_cached(weight_file, fields, cache_dir)
+    for field in fields:
+        assert np.array_equal(first[field], second[field], equal_nan=True)
+        assert np.array_equal(second[field], load_columns(weight_file, fields)[field], equal_nan=True)
+
+    # The error counts are cached with the columns
+    errors = {}
+    load_columns_cached(weight_file, fields, cache_dir, errors=errors)
+    assert errors["Weight"] == {"blank": 2, "invalid": 0}
+
+    # A changed file is parsed again
+    with open(weight_file, "a") as file:
+        file.write('\n2023-05-01,"80,0"\n')
+    assert load_columns_cached(weight_file, fields, cache_dir)["Weight"][-1] == 80.0
+
+    # Other fields are a separate entry, the least recently used entry is evicted when the cache is full
+    load_columns_cached(weight_file, ["Date"], cache_dir)
+    assert len(os.listdir(cache_dir)) == 2
+    sizes = sum(os.path.getsize(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir))
+    load_columns_cached(weight_file, fields, cache_dir)
+    load_columns_cached(weight_file, ["Weight"], cache_dir, max_size=sizes + 100)
+    assert len(os.listdir(cache_dir)) == 2
+    # The "Date" entry was used least recently so it's the one removed
+    entries = [np.load(os.path.join(cache_dir, name)) for name in os.listdir(cache_dir)]
+    assert sorted((len(entry.files), entry["column0"].dtype.kind) for entry in entries) == [(2, "f"), (3, "M")]
+
+    # Errors are not cached
+    with pytest.raises(ValueError):
+        load_columns_cached("test_intake_noData.csv", ["Date"], cache_dir)
+
+    assert clear_cache(cache_dir) == 2
+    assert os.listdir(cache_dir) == []
+
+
+def test_load_year(tmp_path):
+    fields = ["Date", "Calories", "Protein (g)", "Fat (g)", "Carbs (g)"]
+    macros_file = str(tmp_path / "intake.csv")
+    shutil.copy("test_intake.csv", macros_file)
+
+    # Sorted files are indexed by month, only the rows of the year are read
+    index = build_index(macros_file)
+    assert os.path.exists(macros_file + ".index.json")
+    assert index["sorted"] and [*index["months"]] == ["2022-07", "2022-12", "2023-01", "2023-02"]
+    columns = load_year(macros_file, fields, "2023")
+    everything = load_columns(macros_file, fields)
+    for field in fields:
+        assert np.array_equal(columns[field], everything[field][3:], equal_nan=True)
+    assert len(load_year(macros_file, fields, "2024")["Date"]) == 0
+
+    # A changed file is indexed again, unsorted files are read in full
+    with open(macros_file, "a") as file:
+        file.write('\n2022-01-01,"1500",100,50,150\n')
+    assert not build_index(macros_file)["sorted"]
+    assert load_year(macros_file, fields, "2022")["Calories"].tolist()[-1] == 1500.0
+    assert len(load_year(macros_file, fields, "2023")["Date"]) == 8
+
+    # Quoted values can span lines
+    weight_file = str(tmp_path / "weight.csv")
+    with open(weight_file, "w") as file:
+        file.write('Date,Weight,Note\n2022-12-31,"74,0","a\nb"\n2023-01-01,"74,5",\n2023-01-02,"74,7","c"\n')
+    assert build_index(weight_file)["sorted"]
+    assert load_year(weight_file, ["Date", "Weight"], "2023")["Weight"].tolist() == [74.5, 74.7]
+    assert load_year(weight_file, ["Date", "Weight"], "2022")["Weight"].tolist() == [74.0]
+
+    with pytest.raises(ValueError) as info:
+        load_year(weight_file, ["Date", "Calories"], "2023")
+    assert str(info.value) == '(\'Calories\',) field(s) missing/incorrect in: "weight.csv"'
+
+
+def test_binary(tmp_path):
+    weight_fields = ["Date", "Weight"]
+    macros_fields = ["Date", "Calories", "Protein (g)", "Fat (g)", "Carbs (g)"]
+
+    # Loads the same columns as the CSV
+    for f, fields in [("test_weight.csv", weight_fields), ("test_intake.csv", macros_fields), ("Träning - Intake.csv", macros_fields)]:
+        binary = str(tmp_path / "data.amwg")
+        assert write_binary(f, binary) == f"File saved: {binary}"
+        errors, binary_errors = {}, {}
+        columns = load_columns(f, fields, errors)
+        loaded = load_binary(binary, fields, binary_errors)
+        assert binary_errors == errors
+        for field in fields:
+            assert loaded[field].dtype == columns[field].dtype
+            assert np.array_equal(loaded[field], columns[field], equal_nan=True)
+
+        # Exported back to CSV, read again it gives the same values
+        exported = str(tmp_path / "exported.csv")
+        assert export_csv(binary, exported) == f"File saved: {exported}"
+        for field, values in load_columns(exported, fields).items():
+            assert np.array_equal(values, columns[field], equal_nan=True)
+        write_binary(exported, str(tmp_path / "again.amwg"))
+        with open(binary, "rb") as first, open(tmp_path / "again.amwg", "rb") as second:
+            assert first.read() == second.read()
+
+    # Same layout as the original CSV
+    write_binary("test_weight.csv", binary)
+    export_csv(binary, exported)
+    with open(exported) as file:
+        assert file.read().splitlines()[:3] == ["Date,Weight", '2023-03-27,"74,5"', '2023-03-28,"73,6"']
+    assert export_csv(binary) == f"File saved: {tmp_path / 'data.csv'}"
+    with pytest.raises(ValueError) as info:
+        export_csv(binary)
+    assert str(info.value) == f"{tmp_path / 'data.csv'} already exists"
+
+    # Fields not in SCHEMA are kept as text
+    with open(tmp_path / "notes.csv", "w", newline="") as file:
+        file.write('Date,Note,Weight\r\n2023-03-27,"Rest day, tired",74.5\r\n2023-03-28,,73.6\r\n2023-03-29,Åter 🏃,\r\n')
+    write_binary(str(tmp_path / "notes.csv"), binary)
+    assert np.array_equal(load_binary(binary, ["Note"])["Note"], load_columns(str(tmp_path / "notes.csv"), ["Note"])["Note"], equal_nan=True)
+    export_csv(binary, exported)
+    with open(exported, newline="") as file, open(tmp_path / "notes.csv", newline="") as original:
+        assert file.read() == original.read()
+    write_binary("test_intake.csv", binary)
+    export_csv(binary, exported)
+    with open(exported) as file, open("test_intake.csv") as original:
+        assert file.readline() == original.readline()
+
+    # float32 halves the values
+    small = str(tmp_path / "small.amwg")
+    write_binary("Träning - Intake.csv", small, float32=True)
+    write_binary("Träning - Intake.csv", binary)
+    assert os.path.getsize(small) < os.path.getsize(binary)
+    assert np.allclose(load_binary(small, ["Fat (g)"])["Fat (g)"], load_binary(binary, ["Fat (g)"])["Fat (g)"], equal_nan=True)
+
+    # Accepted wherever a CSV is
+    write_binary("test_weight.csv", str(tmp_path / "weight.amwg"))
+    write_binary("test_intake.csv", str(tmp_path / "intake.amwg"))
+    assert check_csv(str(tmp_path / "weight.amwg")) == str(tmp_path / "weight.amwg")
+    assert (run_job(str(tmp_path / "weight.amwg"), str(tmp_path / "intake.amwg"), "2023", fmt="csv") 
+            == run_job("test_weight.csv", "test_intake.csv", "2023", fmt="csv"))
+    assert stream_averages(str(tmp_path / "weight.amwg"), weight_fields, "2023") == stream_averages("test_weight.csv", weight_fields, "2023")
+
+    # Same errors as load_columns
+    with pytest.raises(ValueError) as info:
+        load_binary(binary, ["Date", "Weight"])
+    assert str(info.value) == '(\'Weight\',) field(s) missing/incorrect in: "data.amwg"'
+    (tmp_path / "broken.amwg").write_bytes(b"Date,Weight\n")
+    with pytest.raises(ValueError) as info:
+        load_binary(str(tmp_path / "broken.amwg"), weight_fields)
+    assert str(info.value) == f"{tmp_path / 'broken.amwg'} is not a .amwg file"
+
+
+def test_converter():
+    converter = Converter(["Date", "Weight", "Calories"])
+    assert converter.row(["2023-01-01", "74,5", "1611"]) == ["2023-01-01", 74.5, 1611.0]
+    assert converter.row(["2023-01-02", "74.5", " -12 "]) == ["2023-01-02", 74.5, -12.0]
+    assert converter.row(["2023-01-03", "", "abc"]) is None
+    assert converter.failed == "Weight"
+    assert converter.row(["Jan 4", "74", None]) is None
+    assert converter.failed == "Date"
+    assert converter.errors == {"Date": {"blank": 0, "invalid": 1}, "Weight": {"blank": 1, "invalid": 0}, 
+                                "Calories": {"blank": 1, "invalid": 1}}
+
+    # Dates in any form strptime takes for YYYY-MM-DD, as YYYY-MM-DD
+    dates = Converter(["Date"])
+    assert [dates.row([date]) for date in ["2023-3-5", "2023-03-5", "2023-02-30", "2023-03", "23-03-05"]] == [
+        ["2023-03-05"], ["2023-03-05"], None, None, None]
+    assert dates.column("Date", ["2023-3-5", "2023-02-30", "2023-03", "2023-03-06"]).astype(str).tolist() == [
+        "2023-03-05", "NaT", "NaT", "2023-03-06"]
+    assert dates.errors["Date"] == {"blank": 0, "invalid": 5}
+
+    # Whole columns, with and without values that aren't numbers
+    assert converter.column("Weight", ["74,5", "", "-1.5"]).tolist()[::2] == [74.5, -1.5]
+    assert np.isnan(converter.column("Calories", ["1e5", "1611", "nan"])).tolist() == [True, False, True]
+    assert converter.column("Date", ["2023-01-01", "", "2023-13-01"]).astype(str).tolist() == ["2023-01-01", "NaT", "NaT"]
+    assert converter.errors["Calories"] == {"blank": 1, "invalid": 3}
+    assert converter.errors["Date"] == {"blank": 1, "invalid": 2}
+
+    # Decimal separator from the schema
+    points = Converter(["Weight"], {"Weight": {"type": "number", "decimal": "."}})
+    assert points.row(["74.5"]) == [74.5]
+    assert points.row(["74,5"]) is None
+    with pytest.raises(ValueError):
+        Converter(["Weight"], {"Weight": {"type": "text"}})
+
+
 def test_clean_data():
     # Variables with data so it will work even if collect_data was to break
     weight_data = [ {'Date': '2023-03-27', 'Weight': '74,5'}, 
@@ -77,6 +307,9 @@ def test_clean_data():
                                                 {'Date': '2023-01-31', 'Calories': 1836.0, 'Protein (g)': 215.0, 'Fat (g)': 43.0, 'Carbs (g)': 141.0}, 
                                                 {'Date': '2023-02-01', 'Calories': 2086.0, 'Protein (g)': 203.0, 'Fat (g)': 54.0, 'Carbs (g)': 189.0}, 
                                                 {'Date': '2023-02-02', 'Calories': 1888.0, 'Protein (g)': 184.0, 'Fat (g)': 61.0, 'Carbs (g)': 144.0}]
+    # The input isn't changed
+    assert weight_data[0] == {'Date': '2023-03-27', 'Weight': '74,5'}
+
     # Year not in csv
     with pytest.raises(ValueError) as info:
         assert clean_data(macros_data, empty_year)
@@ -92,8 +325,77 @@ def test_clean_data():
         assert clean_data(macros_no_date, "2023")
     str(info.value) == 'Missing required key "Date"'
 
+    # Columns are cleaned the same way
+    macros_columns = load_columns("test_intake.csv", ["Date", "Calories", "Protein (g)", "Fat (g)", "Carbs (g)"])
+    macros_clean = clean_data(macros_columns, "2023")
+    assert macros_clean["Date"].tolist() == [np.datetime64(date, "D").item() for date in 
+                                             ["2023-01-02", "2023-01-29", "2023-01-30", "2023-01-31", "2023-02-01", "2023-02-02"]]
+    assert macros_clean["Fat (g)"].tolist() == [39.0, 41.0, 48.0, 43.0, 54.0, 61.0]
+
+    with pytest.raises(ValueError) as info:
+        clean_data(macros_columns, empty_year)
+    assert str(info.value) == f"Data contains no entries for {empty_year}"
+
+    weight_columns = load_columns("test_weight.csv", ["Date", "Weight"])
+    with pytest.raises(ValueError) as info:
+        clean_data({"Date": weight_columns["Date"][4:], "Weight": weight_columns["Weight"][4:]}, "2023")
+    assert str(info.value) == "Data input contains no values for some or all of the following: ('Date', 'Weight')"
+
+    # Row counts, the same for rows and columns
+    stats = {}
+    clean_data(collect_data("test_intake.csv", ["Date", "Calories", "Protein (g)", "Fat (g)", "Carbs (g)"]), "2023", stats)
+    assert stats == {"rows_read": 11, "rows_other_years": 3, "rows_dropped": {"Calories": {"blank": 2, "invalid": 0}}, "rows_kept": 6}
+    columns_stats = {}
+    clean_data(macros_columns, "2023", columns_stats)
+    assert columns_stats == stats
+
+    # Dropped rows are split into blank and invalid values, also for columns
+    rows = [{"Date": "2023-01-01", "Weight": "74.5"}, {"Date": "2023-01-02", "Weight": "abc"}, 
+            {"Date": "2023-01-03", "Weight": ""}, {"Date": "2023-01-04", "Weight": "7 4"}]
+    stats, columns_stats = {}, {}
+    clean_data(rows, "2023", stats)
+    converter = Converter(["Date", "Weight"])
+    columns = {field: converter.column(field, [row[field] for row in rows]) for field in ["Date", "Weight"]}
+    clean_data(columns, "2023", columns_stats)
+    assert stats["rows_dropped"] == columns_stats["rows_dropped"] == {"Weight": {"blank": 1, "invalid": 2}}
+
+
+def test_join_data():
+    weight = {"Date": np.array(["2023-01-03", "2023-01-01", "2023-01-02", "2023-01-09"], dtype="datetime64[D]"),
+              "Weight": np.array([75.0, 74.0, 74.5, 76.0])}
+    macros = {"Date": np.array(["2023-01-01", "2023-01-02", "2023-01-02", "2023-01-05"], dtype="datetime64[D]"),
+              "Calories": np.array([1800.0, 2000.0, 2200.0, 1900.0])}
+
+    # Only the dates in both, a date found twice is joined with both rows
+    joined = join_data(macros, weight)
+    assert joined["Date"].astype(str).tolist() == ["2023-01-01", "2023-01-02", "2023-01-02"]
+    assert joined["Calories"].tolist() == [1800.0, 2000.0, 2200.0]
+    assert joined["Weight"].tolist() == [74.0, 74.5, 74.5]
+
+    # Every date, sorted, with NaN for the file missing it
+    joined = join_data(macros, weight, "outer")
+    assert joined["Date"].astype(str).tolist() == ["2023-01-01", "2023-01-02", "2023-01-02", "2023-01-03", "2023-01-05", "2023-01-09"]
+    assert np.isnan(joined["Calories"]).tolist() == [False, False, False, True, False, True]
+    assert np.isnan(joined["Weight"]).tolist() == [False, False, False, False, True, False]
+
+    # The weight a few days later, and only the rows of a year
+    joined = join_data(macros, weight, lag=4)
+    assert joined["Date"].astype(str).tolist() == ["2023-01-05"]
+    assert joined["Weight"].tolist() == [76.0]
+    assert join_data(macros, weight, "outer", year="2022")["Date"].tolist() == []
+
+    # The result can be averaged like a single file
+    assert average_data(join_data(macros, weight)) == {'Calories': {'January': 2000.0}, 'Weight': {'January': 74.3}}
+
+    with pytest.raises(ValueError) as info:
+        join_data(macros, weight, "left")
+    assert str(info.value) == 'Join must be "inner" or "outer", not \'left\''
+    with pytest.raises(ValueError) as info:
+        join_data(weight, weight)
+    assert str(info.value) == 'Field "Weight" is in both, it can only be joined from one of them'
 
-def test_average_data():
+
+def test_average_data(tmp_path):
     macros_clean = [{'Date': '2023-01-02', 'Calories': 1588.0, 'Protein (g)': 203.0, 'Fat (g)': 39.0, 'Carbs (g)': 105.0}, 
                     {'Date': '2023-01-29', 'Calories': 1986.0, 'Protein (g)': 209.0, 'Fat (g)': 41.0, 'Carbs (g)': 190.0}, 
                     {'Date': '2023-01-30', 'Calories': 1832.0, 'Protein (g)': 215.0, 'Fat (g)': 48.0, 'Carbs (g)': 130.0}, 
@@ -114,6 +416,241 @@ def test_average_data():
                     ]
     assert average_data(weight_clean) == {'Weight': {'March': 74.0, 'April': 74.2}}
 
+    # Columns give the same averages
+    weight_columns = clean_data(load_columns("test_weight.csv", ["Date", "Weight"]), "2023")
+    assert average_data(weight_columns) == {'Weight': {'March': 74.0, 'April': 74.2}}
+    macros_columns = clean_data(load_columns("test_intake.csv", ["Date", "Calories", "Protein (g)", "Fat (g)", "Carbs (g)"]), "2023")
+    assert average_data(macros_columns) == average_data(macros_clean)
+    for field in ["Calories", "Protein (g)", "Fat (g)", "Carbs (g)"]:
+        for month, number in [("January", "01"), ("February", "02")]:
+            values = [row[field] for row in macros_clean if row["Date"][5:7] == number]
+            assert average_data(macros_clean)[field][month] == round(statistics.mean(values), 1)
+            assert average_data(macros_columns)[field][month] == round(statistics.mean(values), 1)
+
+    # Dates without leading zeros are kept, as they were with strptime
+    (tmp_path / "short.csv").write_text("Date,Weight\n2023-03-27,74.5\n2023-3-28,75.5\n")
+    f = str(tmp_path / "short.csv")
+    assert average_data(clean_data(load_columns(f, ["Date", "Weight"]), "2023")) == {"Weight": {"March": 75.0}}
+    assert average_data(clean_data(collect_data(f, ["Date", "Weight"]), "2023")) == {"Weight": {"March": 75.0}}
+    assert stream_averages(f, ["Date", "Weight"], "2023") == {"Weight": {"March": 75.0}}
+
+    # The same averages as statistics.mean and stream_averages, also where a float sum rounds differently
+    weights = [74.9, 69.6, 86.0, 74.2, 71.1, 75.5, 85.0, 76.9, 67.2, 63.0, 62.0, 60.1, 79.8, 84.1, 88.7, 65.1]
+    rows = [{'Date': f'2023-01-{day:02d}', 'Weight': weight} for day, weight in enumerate(weights, 1)]
+    assert round(sum(weights) / len(weights), 1) == 73.9
+    assert average_data(rows) == {'Weight': {'January': round(statistics.mean(weights), 1)}} == {'Weight': {'January': 74.0}}
+    assert window_averages(rows, 16)['Weight']['2023-01-16'] == 74.0
+    (tmp_path / "weight.csv").write_text("Date,Weight\n" + "".join(f"{row['Date']},{row['Weight']}\n" for row in rows))
+    f = str(tmp_path / "weight.csv")
+    assert average_data(clean_data(load_columns(f, ["Date", "Weight"]), "2023")) == stream_averages(f, ["Date", "Weight"], "2023")
+
+    # Months are in chronological order even if the rows are not
+    assert [*average_data(weight_clean[::-1])["Weight"].keys()] == ['March', 'April']
+
+    # Quantiles after each key, exact for small inputs, the same for rows and columns
+    assert average_data(weight_clean, quantiles=True) == {'Weight': {'March': 74.0, 'April': 74.2}, 
+                                                          'Weight (p10)': {'March': 73.7, 'April': 74.1}, 
+                                                          'Weight (median)': {'March': 74.0, 'April': 74.2}, 
+                                                          'Weight (p90)': {'March': 74.4, 'April': 74.3}}
+    assert average_data(weight_columns, quantiles=True) == average_data(weight_clean, quantiles=True)
+    assert [*average_data(macros_clean, quantiles=True).keys()][:5] == ['Calories', 'Calories (p10)', 'Calories (median)', 
+                                                                        'Calories (p90)', 'Protein (g)']
+
+
+def test_quantile_estimator(monkeypatch):
+    # Exact, the same as numpy, while there are few values
+    estimator = QuantileEstimator([0.1, 0.5, 0.9])
+    assert np.isnan(estimator.result()).all()
+    estimator.extend([5, 1, 4, 2, 3])
+    assert estimator.result() == [1.4, 3.0, 4.6]
+
+    # Estimated, close to the exact quantiles, with only a few values kept
+    values = np.random.default_rng(0).normal(75, 2, 20000)
+    estimator = QuantileEstimator([0.1, 0.5, 0.9], exact=5)
+    estimator.extend(values)
+    assert estimator.count == 20000
+    assert np.allclose(estimator.result(), np.quantile(values, [0.1, 0.5, 0.9]), atol=0.05)
+    for count in range(6, 20):
+        estimator = QuantileEstimator([0.1, 0.5, 0.9], exact=5)
+        estimator.extend(values[:count])
+        assert min(values[:count]) <= min(estimator.result()) <= max(estimator.result()) <= max(values[:count])
+
+    # Streamed and columns give the same estimates
+    monkeypatch.setattr("project.EXACT_QUANTILES", 5)
+    fields = ["Date", "Calories", "Protein (g)", "Fat (g)", "Carbs (g)"]
+    streamed = stream_averages("Träning - Intake.csv", fields, "2023", quantiles=True)
+    assert streamed == average_data(clean_data(load_columns("Träning - Intake.csv", fields), "2023"), quantiles=True)
+    assert streamed["Calories"] == stream_averages("Träning - Intake.csv", fields, "2023")["Calories"]
+
+
+def test_window_averages():
+    weight_clean = [{'Date': '2023-03-27', 'Weight': 74.5}, 
+                    {'Date': '2023-03-28', 'Weight': 73.6}, 
+                    {'Date': '2023-04-01', 'Weight': 74.1}, 
+                    {'Date': '2023-04-02', 'Weight': 74.3},
+                    {'Date': '2023-04-03', 'Weight': 74.9}
+                    ]
+    assert window_averages(weight_clean, "month") == average_data(weight_clean)
+    assert window_averages(weight_clean, "day") == {'Weight': {'2023-03-27': 74.5, '2023-03-28': 73.6, '2023-04-01': 74.1, 
+                                                               '2023-04-02': 74.3, '2023-04-03': 74.9}}
+    # ISO weeks start on Monday
+    assert window_averages(weight_clean, "week") == {'Weight': {'2023-W13': 74.1, '2023-W14': 74.9}}
+
+    # Rolling averages end on each day with at least one value in the window
+    assert window_averages(weight_clean, 3) == {'Weight': {'2023-03-27': 74.5, '2023-03-28': 74.0, '2023-03-29': 74.0, 
+                                                           '2023-03-30': 73.6, '2023-04-01': 74.1, '2023-04-02': 74.2, 
+                                                           '2023-04-03': 74.4}}
+
+    # Columns give the same averages, NaN is left out
+    macros_columns = clean_data(load_columns("test_intake.csv", ["Date", "Calories", "Protein (g)", "Fat (g)", "Carbs (g)"]), "2023")
+    assert window_averages(macros_columns, "week")["Calories"] == {'2023-W01': 1588.0, '2023-W04': 1986.0, '2023-W05': 1910.5}
+    assert window_averages(macros_columns, 28)["Calories"]["2023-01-29"] == 1787.0
+    columns = {"Date": np.array(["2023-01-01", "2023-01-02"], dtype="datetime64[D]"), "Weight": np.array([np.nan, 75.0])}
+    assert window_averages(columns, 7) == {'Weight': {'2023-01-02': 75.0}}
+
+    for window in ["year", 0, "7"]:
+        with pytest.raises(ValueError):
+            window_averages(weight_clean, window)
+
+
+def test_stream_averages():
+    weight_fields = ["Date", "Weight"]
+    macros_fields = ["Date", "Calories", "Protein (g)", "Fat (g)", "Carbs (g)"]
+
+    # Same averages as collect_data, clean_data and average_data
+    assert stream_averages("test_weight.csv", weight_fields, "2023") == {'Weight': {'March': 74.0, 'April': 74.2}}
+    for f, fields in [("test_intake.csv", macros_fields), ("Träning - Intake.csv", macros_fields), ("Träning - Weight.csv", weight_fields)]:
+        for year in ["2022", "2023"]:
+            try:
+                expected = average_data(clean_data(collect_data(f, fields), year))
+            except ValueError as err:
+                with pytest.raises(ValueError) as info:
+                    stream_averages(f, fields, year)
+                assert str(info.value) == str(err)
+            else:
+                assert stream_averages(f, fields, year) == expected
+
+    # Same errors
+    with pytest.raises(ValueError) as info:
+        stream_averages("test_intake.csv", macros_fields, "2024")
+    assert str(info.value) == "Data contains no entries for 2024"
+    with pytest.raises(ValueError) as info:
+        stream_averages("test_intake.csv", ["Calories"], "2023")
+    assert str(info.value) == 'Missing required key "Date"'
+    with pytest.raises(ValueError) as info:
+        stream_averages("test_intake_noData.csv", macros_fields, "2023")
+    assert str(info.value) == "No data was appended"
+    with pytest.raises(ValueError) as info:
+        stream_averages("test_weight_noDate_field.csv", weight_fields, "2023")
+    assert str(info.value) == '(\'Date\',) field(s) missing/incorrect in: "test_weight_noDate_field.csv"'
+
+
+def test_parallel_averages(tmp_path):
+    weight_fields = ["Date", "Weight"]
+    macros_fields = ["Date", "Calories", "Protein (g)", "Fat (g)", "Carbs (g)"]
+
+    # Same averages as stream_averages, with parts small enough to cut the files in many places
+    for f, fields in [("test_weight.csv", weight_fields), ("Träning - Intake.csv", macros_fields), ("Träning - Weight.csv", weight_fields)]:
+        assert parallel_averages(f, fields, "2023", workers=2, chunk_size=2048) == stream_averages(f, fields, "2023")
+        assert parallel_averages(f, fields, "2023", workers=2, chunk_size=30) == stream_averages(f, fields, "2023")
+
+    # Quoted values with commas and newlines at the edges of the parts
+    notes = tmp_path / "notes.csv"
+    notes.write_text("Date,Weight,Note\n" + "".join(
+        f'2023-0{day % 9 + 1}-01,"7{day % 10},{day}","line, one\n""two""\nthree"\n' for day in range(200)
+        ))
+    assert parallel_averages(str(notes), weight_fields, "2023", workers=2, chunk_size=64) == stream_averages(str(notes), weight_fields, "2023")
+
+    # Same errors
+    for f, fields, year in [("test_intake.csv", macros_fields, "2024"), ("test_intake.csv", ["Calories"], "2023"),
+                            ("test_intake_noData.csv", macros_fields, "2023"), ("test_weight_noDate_field.csv", weight_fields, "2023")]:
+        with pytest.raises(ValueError) as info:
+            parallel_averages(f, fields, year, workers=2, chunk_size=30)
+        with pytest.raises(ValueError) as expected:
+            stream_averages(f, fields, year)
+        assert str(info.value) == str(expected.value)
+
+
+def test_incremental_averages(tmp_path):
+    state_dir = str(tmp_path / "state")
+    weight_file = str(tmp_path / "weight.csv")
+    shutil.copy("test_weight.csv", weight_file)
+    fields = ["Date", "Weight"]
+
+    assert incremental_averages(weight_file, fields, "2023", state_dir) == {'Weight': {'March': 74.0, 'April': 74.2}}
+    assert len(os.listdir(state_dir)) == 1
+
+    # Rows added at the end are picked up, also before the line is finished
+    with open(weight_file, "a") as file:
+        file.write('\n2023-04-05,"76,2"\n2023-05-01,"80,0"')
+    assert incremental_averages(weight_file, fields, "2023", state_dir) == {'Weight': {'March': 74.0, 'April': 74.9, 'May': 80.0}}
+    with open(weight_file, "a") as file:
+        file.write('\n2023-05-02,"81,0"\n')
+    assert incremental_averages(weight_file, fields, "2023", state_dir) == stream_averages(weight_file, fields, "2023")
+    assert incremental_averages(weight_file, fields, "2023", state_dir)["Weight"]["May"] == 80.5
+
+    # A rewritten file is read again from the start
+    with open(weight_file, "w") as file:
+        file.write('Date,Weight\n2023-03-27,"70,0"\n2023-03-28,"72,0"\n2023-04-01,"74,1"\n2023-04-02,"74,3"\n2023-05-02,"81,0"\n')
+    assert incremental_averages(weight_file, fields, "2023", state_dir) == {'Weight': {'March': 71.0, 'April': 74.2, 'May': 81.0}}
+
+    # An edit far from the end that keeps the size the same is noticed too
+    with open(weight_file, "a") as file:
+        file.write("".join(f'2023-06-{day:02d},"75,0"\n' for day in range(1, 31)) * 10)
+    assert incremental_averages(weight_file, fields, "2023", state_dir)["Weight"]["March"] == 71.0
+    with open(weight_file, "rb") as file:
+        text = file.read()
+    with open(weight_file, "wb") as file:
+        file.write(text.replace(b'"70,0"', b'"99,0"'))
+    assert incremental_averages(weight_file, fields, "2023", state_dir) == stream_averages(weight_file, fields, "2023")
+    assert incremental_averages(weight_file, fields, "2023", state_dir)["Weight"]["March"] == 85.5
+
+    # The saved sums are part of the cache
+    assert clear_cache(state_dir) == 1
+    assert os.listdir(state_dir) == []
+
+    # Same errors
+    with pytest.raises(ValueError) as info:
+        incremental_averages(weight_file, fields, "2024", state_dir)
+    assert str(info.value) == "Data contains no entries for 2024"
+    with pytest.raises(ValueError) as info:
+        incremental_averages("test_intake_noData.csv", ["Date", "Calories"], "2023", state_dir)
+    assert str(info.value) == "No data was appended"
+    with pytest.raises(ValueError) as info:
+        incremental_averages("test_weight_noDate_field.csv", fields, "2023", state_dir)
+    assert str(info.value) == '(\'Date\',) field(s) missing/incorrect in: "test_weight_noDate_field.csv"'
+
+
+def test_graph_years(tmp_path):
+    # A year that can't be saved gets a message like a skipped one, for graphs and formats
+    missing = str(tmp_path / "missing")
+    for fmt, f in [(None, "averages_2023.png"), ("json", "averages_2023.json")]:
+        messages = graph_years("test_weight.csv", "test_intake.csv", ["Date", "Weight"], 
+                               ["Date", "Calories", "Protein (g)", "Fat (g)", "Carbs (g)"], ["2023", "2024"], out=missing, fmt=fmt)
+        assert messages[0].startswith("2023: [Errno 2] No such file or directory") and messages[0].endswith(f"{os.path.join(missing, f)}'")
+        assert messages[1] == "2024: Data contains no entries for 2024"
+
+    messages = graph_years("test_weight.csv", "test_intake.csv", ["Date", "Weight"], 
+                           ["Date", "Calories", "Protein (g)", "Fat (g)", "Carbs (g)"], ["2023"], out=str(tmp_path))
+    assert messages == [f"File saved: {tmp_path / 'averages_2023.png'}"]
+
+
+def test_partition_years():
+    macros_fields = ["Date", "Calories", "Protein (g)", "Fat (g)", "Carbs (g)"]
+    macros = load_columns("test_intake.csv", macros_fields)
+    years = partition_years(macros)
+    assert [*years.keys()] == ["2022", "2023"]
+    assert len(years["2022"]["Date"]) == 3
+    assert len(years["2023"]["Date"]) == 8
+
+    # Each year averages the same as cleaning the whole file for that year
+    for year in years:
+        assert average_data(clean_data(years[year], year)) == average_data(clean_data(macros, year))
+
+    with pytest.raises(ValueError) as info:
+        partition_years({"Calories": macros["Calories"]})
+    assert str(info.value) == 'Missing required key "Date"'
+
 
 def test_get_files_year(monkeypatch):
     # inputs is an iterator object, allowing the call of next to go through the list.
@@ -125,6 +662,11 @@ def test_get_files_year(monkeypatch):
     returns = get_files_year()
     assert returns == ["test_weight.csv", "test_intake.csv", "2023"]
 
+    # Only the files
+    inputs = iter(["test_weight.csv", "test_intake.csv"])
+    monkeypatch.setattr("builtins.input", lambda _: next(inputs))
+    assert get_files_year(ask_year=False) == ["test_weight.csv", "test_intake.csv"]
+
     # Incorrect inputs, will prompt again so it should still get the correct values
     inputs = iter([" ", "test_weight.csv", "cat", "test_intake.csv", "ad02", "2023"])
     monkeypatch.setattr("builtins.input", lambda _: next(inputs))
@@ -133,7 +675,132 @@ def test_get_files_year(monkeypatch):
     assert returns == ["test_weight.csv", "test_intake.csv", "2023"]
 
 
-def test_draw_graph():
+def test_check_csv():
+    assert check_csv("test_weight.csv") == "test_weight.csv"
+    with pytest.raises(ValueError) as info:
+        check_csv("macros.txt")
+    assert str(info.value) == "macros.txt is not a CSV"
+    with pytest.raises(ValueError) as info:
+        check_csv("macros1.csv")
+    assert str(info.value) == "macros1.csv does not exist"
+
+
+def test_check_year():
+    assert check_year("2023") == "2023"
+    for year in ["ad02", "20233", "", "23"]:
+        with pytest.raises(ValueError) as info:
+            check_year(year)
+        assert str(info.value) == "Please provide a year in YYYY format"
+
+
+def test_run_job(tmp_path):
+    out = str(tmp_path / "averages.json")
+    runs = []
+    assert run_job("test_weight.csv", "test_intake.csv", "2023", out, fmt="json", on_stats=runs.append) == f"File saved: {out}"
+    stats = runs[0]
+    assert list(stats["stages"]) == ["collect", "clean", "average", "write"]
+    assert all(stage["seconds"] >= 0 and stage["peak_bytes"] > 0 for stage in stats["stages"].values())
+    assert stats["weight"] == {"errors": {"Date": {"blank": 0, "invalid": 0}, "Weight": {"blank": 2, "invalid": 0}},
+                               "rows_read": 6, "rows_other_years": 0, "rows_dropped": {"Weight": {"blank": 2, "invalid": 0}}, 
+                               "rows_kept": 4, "months": 2}
+    assert stats["macros"]["months"] == 2
+    json.dumps(stats)
+
+    # Timed without tracing memory, the peaks come from a second, traced, run
+    traced = []
+    def load(f, fields, errors=None):
+        traced.append(tracemalloc.is_tracing())
+        return load_columns(f, fields, errors)
+    run_job("test_weight.csv", "test_intake.csv", "2023", out, load=load, fmt="json", on_stats=runs.append)
+    assert traced == [False, False, True, True]
+    assert all(stage["peak_bytes"] > 0 for stage in runs[-1]["stages"].values())
+    del runs[-1]
+
+    # Failed runs are reported too
+    with pytest.raises(ValueError):
+        run_job("test_weight.csv", "test_intake.csv", "2024", out, fmt="json", on_stats=runs.append)
+    assert runs[1]["error"] == "Data contains no entries for 2024"
+    assert runs[1]["weight"]["rows_other_years"] == 6
+
+    # Joined by date, the weight and intake test files have no days in common
+    with pytest.raises(ValueError) as info:
+        run_job("test_weight.csv", "test_intake.csv", "2023", out, fmt="json", on_stats=runs.append, join="inner")
+    assert str(info.value) == "Data contains no joined entries for 2023"
+    assert list(runs[2]["stages"]) == ["collect", "clean", "join"]
+    assert runs[2]["join"] == {"how": "inner", "lag": 0, "rows": 0}
+    run_job("test_weight.csv", "test_intake.csv", "2023", out, fmt="json", join="outer")
+    with open(out) as file:
+        assert json.load(file)["averages"] == {'Calories': {'January': 1810.5, 'February': 1987.0}, 
+                                               'Protein (g)': {'January': 210.5, 'February': 193.5}, 
+                                               'Fat (g)': {'January': 42.8, 'February': 57.5}, 
+                                               'Carbs (g)': {'January': 141.5, 'February': 166.5}, 
+                                               'Weight': {'March': 74.0, 'April': 74.2}}
+
+
+def test_run_manifest(tmp_path):
+    manifest = tmp_path / "jobs.json"
+    manifest.write_text(json.dumps([
+        {"weight": "test_weight.csv", "macros": "macros.txt", "year": "2023"},
+        {"weight": "test_weight.csv", "macros": "test_intake.csv", "year": "23"},
+        {"weight": "test_weight.csv", "macros": "test_intake.csv", "year": 2024},
+        {"weight": "test_weight.csv", "year": "2023"},
+        ]))
+    assert run_manifest(str(manifest), workers=2) == [
+        ["Job 1", False, "Error: macros.txt is not a CSV"],
+        ["Job 2", False, "Error: Please provide a year in YYYY format"],
+        ["Job 3", False, "Error: Data contains no entries for 2024"],
+        ["Job 4", False, "Error: Missing 'macros'"],
+        ]
+
+    # Jobs from a CSV manifest
+    manifest = tmp_path / "jobs.csv"
+    manifest.write_text("weight,macros,year,out\ntest_intake.csv,test_weight.csv,2023,\n")
+    assert run_manifest(str(manifest), workers=1) == [
+        ["Job 1", False, "Error: ('Weight',) field(s) missing/incorrect in: \"test_intake.csv\""]
+        ]
+
+    with pytest.raises(ValueError):
+        run_manifest(str(tmp_path / "missing.json"))
+
+    # A valid job saves its graph
+    out = str(tmp_path / "averages.png")
+    manifest.write_text(f"weight,macros,year,out\ntest_weight.csv,test_intake.csv,2023,{out}\n")
+    assert run_manifest(str(manifest), workers=1) == [["Job 1", True, f"File saved: {out}"]]
+    assert os.path.exists(out)
+
+    # A job with a format and no out gives the averages, and still counts as done
+    manifest = tmp_path / "format.json"
+    manifest.write_text(json.dumps([{"weight": "test_weight.csv", "macros": "test_intake.csv", "year": "2023", "format": "json"}]))
+    [[job, ok, message]] = run_manifest(str(manifest), workers=1)
+    assert ok and json.loads(message)["averages"]["Weight"] == {'March': 74.0, 'April': 74.2}
+    result = subprocess.run([sys.executable, "project.py", "--manifest", str(manifest), "--no-cache"], capture_output=True, text=True)
+    assert result.returncode == 0 and "failed" not in result.stderr
+
+
+def test_write_averages(tmp_path):
+    macros_avg = {'Calories': {'January': 1810.5, 'February': 1987.0}, 
+                'Protein (g)': {'January': 210.5, 'February': 193.5}}
+    weight_avg = {'Weight': {'February': 74.0, 'March': 74.2}}
+
+    assert json.loads(write_averages(weight_avg, macros_avg, "2023", "json")) == {"year": "2023", "averages": {**weight_avg, **macros_avg}}
+    assert write_averages(weight_avg, macros_avg, "2023", "csv") == ("Month,Weight,Calories,Protein (g)\n"
+                                                                      "January,,1810.5,210.5\n"
+                                                                      "February,74.0,1987.0,193.5\n"
+                                                                      "March,74.2,,")
+    out = str(tmp_path / "averages.csv")
+    assert write_averages(weight_avg, macros_avg, "2023", "csv", out) == f"File saved: {out}"
+    with open(out) as file:
+        assert file.read() == write_averages(weight_avg, macros_avg, "2023", "csv") + "\n"
+
+    with pytest.raises(ValueError):
+        write_averages(weight_avg, macros_avg, "2023", "xml")
+
+    # Writing the numbers doesn't need matplotlib
+    code = "import project, sys; project.run_job('test_weight.csv', 'test_intake.csv', '2023', fmt='json'); print('matplotlib' in sys.modules)"
+    assert subprocess.run([sys.executable, "-c", code], capture_output=True, text=True).stdout == "False\n"
+
+
+def test_draw_graph(tmp_path):
     year = "2023"
     macros_avg = {'Calories': {'January': 1810.5, 'February': 1987.0}, 
                 'Protein (g)': {'January': 210.5, 'February': 193.5}, 
@@ -146,4 +813,140 @@ def test_draw_graph():
     cwd = os.getcwd()
     assert draw_graph(weight_avg, macros_avg, year) == f"File saved: {cwd}\\averages_{year}.png"
 
-# https://pavolkutaj.medium.com/simulating-single-and-multiple-inputs-using-pytest-and-monkeypatch-6968274f7eb9
\ No newline at end of file
+    # The plot object is reused, drawing the same graph again gives the same image
+    first, second = str(tmp_path / "first.png"), str(tmp_path / "second.png")
+    assert draw_graph(weight_avg, macros_avg, year, first) == f"File saved: {first}"
+    draw_graph({'Weight': {'May': 80.0}}, {key: {'May': 1.0} for key in macros_avg}, "2024", str(tmp_path / "other.png"))
+    draw_graph(weight_avg, macros_avg, year, second)
+    with open(first, "rb") as a, open(second, "rb") as b:
+        assert a.read() == b.read()
+
+    # Bands for the quantiles
+    quantiles = {f"{field} ({name})": values for field in ["Weight", "Calories"] for name in ["p10", "median", "p90"] 
+                 for values in [(weight_avg if field == "Weight" else macros_avg)[field]]}
+    banded = str(tmp_path / "banded.png")
+    assert draw_graph({**weight_avg, **quantiles}, {**macros_avg, **quantiles}, year, banded) == f"File saved: {banded}"
+
+    # Daily averages for a whole year, only some of the days are labeled
+    days = [str(day) for day in np.arange("2023-01-01", "2024-01-01", dtype="datetime64[D]")]
+    daily = str(tmp_path / "daily.png")
+    assert draw_graph({'Weight': dict.fromkeys(days, 75.0)}, {key: dict.fromkeys(days, 100.0) for key in macros_avg}, year, daily) == f"File saved: {daily}"
+
+# https://pavolkutaj.medium.com/simulating-single-and-multiple-inputs-using-pytest-and-monkeypatch-6968274f7eb9
+
+
+def test_report_server(tmp_path):
+    weight_file, macros_file = str(tmp_path / "weight.csv"), str(tmp_path / "intake.csv")
+    shutil.copy("test_weight.csv", weight_file)
+    shutil.copy("test_intake.csv", macros_file)
+    cache = ReportCache(workers=1)
+
+    try:
+        # Rendered once, then served from the cache
+        png = cache.graph(weight_file, macros_file, "2023")
+        assert png.startswith(b"\x89PNG")
+        assert cache.graph(weight_file, macros_file, "2023") == png
+        assert [cache.renders, cache.hits] == [1, 1]
+        assert png == render_graph(*cache.averages(weight_file, macros_file, "2023")[:2], "2023")
+
+        # A changed file gives a new graph and the old one is dropped
+        with open(weight_file, "a") as file:
+            file.write('\n2023-05-01,"80,0"\n')
+        cache.graph(weight_file, macros_file, "2023")
+        assert [cache.renders, len(cache._graphs)] == [2, 1]
+
+        # Only the last max_files files are kept parsed
+        cache.max_files = 2
+        cache.columns("test_weight.csv", ["Date", "Weight"])
+        assert len(cache._files) == 2 and (os.path.abspath("test_weight.csv"), "Date", "Weight") in cache._files
+        cache.max_files = 16
+
+        # Over HTTP, files in requests are read from tmp_path
+        (tmp_path / "dir.csv").mkdir()
+        server = make_server(0, weight_file, macros_file, cache, root=str(tmp_path))
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f"http://127.0.0.1:{server.server_address[1]}"
+        try:
+            with urllib.request.urlopen(f"{url}/averages.json?year=2023") as response:
+                assert json.loads(response.read())["averages"]["Weight"] == {"March": 74.0, "April": 74.2, "May": 80.0}
+            with urllib.request.urlopen(f"{url}/averages.png?year=2023") as response:
+                assert response.headers["Content-Type"] == "image/png"
+                assert cache.hits == 2
+            for path, status, message in [
+                ("/averages.png?year=23", 400, "Please provide a year in YYYY format"),
+                ("/averages.json?year=2024", 400, "Data contains no entries for 2024"),
+                (f"/averages.json?year=2023&weight={macros_file}&macros={weight_file}", 400, 
+                 '(\'Weight\',) field(s) missing/incorrect in: "intake.csv"'),
+                ("/other", 404, "Not found, use /averages.png or /averages.json"),
+                ("/averages.json?year=2023&weight=/etc/passwd.csv", 403, "/etc/passwd.csv is not in the served directory"),
+                (f"/averages.json?year=2023&weight={tmp_path / 'dir.csv'}", 500, f"Can't read {tmp_path / 'dir.csv'}: Is a directory"),
+                ]:
+                with pytest.raises(urllib.error.HTTPError) as info:
+                    urllib.request.urlopen(f"{url}{path}")
+                assert info.value.code == status
+                assert info.value.read().decode() == message
+        finally:
+            server.shutdown()
+            server.server_close()
+    finally:
+        cache.close()
+
+
+def test_watch(tmp_path):
+    weight_file, macros_file = str(tmp_path / "weight.csv"), str(tmp_path / "intake.csv")
+    shutil.copy("test_weight.csv", weight_file)
+    shutil.copy("test_intake.csv", macros_file)
+    out = str(tmp_path / "averages.json")
+    updates = []
+    stop = threading.Event()
+    thread = threading.Thread(target=watch, args=(weight_file, macros_file, "2023", out, "json", 0.02, 0.05, str(tmp_path)),
+                              kwargs={"stop": stop, "on_update": updates.append})
+
+    def wait_for(count):
+        deadline = time.time() + 10
+        while len(updates) < count and time.time() < deadline:
+            time.sleep(0.02)
+        return updates
+
+    thread.start()
+    try:
+        # Saved right away
+        assert wait_for(1) == [f"Updated January, February, March, April. File saved: {out}"]
+
+        # Only saved again when the averages change, once for a burst of writes
+        with open(weight_file, "a") as file:
+            file.write('\n2022-05-01,"80,0"\n')
+        time.sleep(0.3)
+        assert len(updates) == 1
+        for day in ["02", "03", "04"]:
+            with open(weight_file, "a") as file:
+                file.write(f'2023-05-{day},"80,0"\n')
+            time.sleep(0.01)
+        assert wait_for(2)[1] == f"Updated May. File saved: {out}"
+        time.sleep(0.3)
+        assert len(updates) == 2
+        with open(out) as saved:
+            assert json.load(saved)["averages"]["Weight"]["May"] == 80.0
+
+        # Errors are reported and watching goes on
+        os.remove(macros_file)
+        assert wait_for(3)[2].startswith("Error: ")
+        shutil.copy("test_intake.csv", macros_file)
+        with open(macros_file, "a") as file:
+            file.write('\n2023-06-01,2000,200,50,150\n')
+        assert wait_for(4)[3] == f"Updated June. File saved: {out}"
+
+        # An edit to an old row, far from the end and keeping the size, is picked up as well
+        with open(weight_file, "a") as file:
+            file.write("".join(f'2023-06-{day:02d},"75,0"\n' for day in range(1, 31)) * 10)
+        assert wait_for(5)[4] == f"Updated June. File saved: {out}"
+        with open(weight_file, "rb") as file:
+            text = file.read()
+        with open(weight_file, "wb") as file:
+            file.write(text.replace(b'2023-03-27,"74,5"', b'2023-03-27,"99,5"'))
+        assert wait_for(6)[5] == f"Updated March. File saved: {out}"
+        with open(out) as saved:
+            assert json.load(saved)["averages"]["Weight"]["March"] == 86.5
+    finally:
+        stop.set()
+        thread.join()